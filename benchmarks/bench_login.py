@@ -0,0 +1,56 @@
+"""
+登录吞吐量基准测试：不同密码哈希 cost（PBKDF2 迭代次数）下，
+单次验证耗时和多个请求线程同时登录时每秒可完成的登录数
+按峰值登录速率选择配置 PASSWORD_HASH_ITERATIONS（环境变量 HOTEL_PASSWORD_ITERATIONS）
+在仓库根目录运行：
+    python -m benchmarks.bench_login
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.passwords import PasswordHasher
+
+COSTS = (50_000, 100_000, 200_000, 400_000, 600_000)
+
+
+def single_latency(hasher, stored, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hasher.verify('secret', stored)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def throughput(hasher, stored, clients, duration=2.):
+    # clients 个请求线程不断登录，各自在本线程中验证（与 login 相同）
+    deadline = time.perf_counter() + duration
+
+    def client():
+        count = 0
+        while time.perf_counter() < deadline:
+            hasher.verify('secret', stored)
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        total = sum(executor.map(lambda _: client(), range(clients)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    clients = (os.cpu_count() or 1) * 4
+    print(f'cpus: {os.cpu_count()}, concurrent clients: {clients}')
+    print(f"{'iterations':>10} {'verify (ms)':>12} {'logins/s':>10}")
+    for iterations in COSTS:
+        hasher = PasswordHasher(iterations)
+        stored = hasher.hash('secret')
+        latency = single_latency(hasher, stored)
+        rate = throughput(hasher, stored, clients)
+        print(f'{iterations:>10} {latency * 1e3:>12.1f} {rate:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+SQLite 读写混合基准测试：一个线程模拟调度器（批量写回房间状态 + 插入详单并提交），
+同时 N 个线程请求 /rooms，比较各 SQLITE_PROFILE 下读请求和写事务的 p50/p99 延迟与错误数
+在仓库根目录运行：
+    python -m benchmarks.bench_sqlite [--rooms 200] [--readers 8] [--seconds 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import end
+from utils.enums import FanSpeed, Role
+
+
+def percentile(samples, q):
+    if not samples:
+        return float('nan')
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def prepare(app, rooms):
+    with app.app_context():
+        end.init_db(app)
+        for i in range(rooms):
+            end.db.session.add(end.Room(roomName=f'bench-{i}', roomDescription='', unitPrice=100, acTemperature=25,
+                                        fanSpeed=FanSpeed.MEDIUM, acMode=end.AcMode.COOL))
+        end.db.session.commit()
+        return end.db.session.query(end.Account).filter_by(role=Role.manager).first().accountID
+
+
+def writer(app, stop, latencies, errors, interval):
+    # 与调度器写回相同的写法：一个事务内 bulk_update_mappings + executemany 插入详单
+    with app.app_context():
+        roomIDs = [roomID for roomID, in end.db.session.query(end.Room.roomID)]
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                end.db.session.bulk_update_mappings(end.Room, [
+                    dict(roomID=roomID, roomTemperature=20 + random.random() * 10) for roomID in roomIDs])
+                now = datetime.now()
+                end.db.session.execute(end.RoomRecord.__table__.insert(), [
+                    dict(roomID=random.choice(roomIDs), customSessionID=None, requestTime=now, serveStartTime=now,
+                         serveEndTime=now, fanSpeed='MEDIUM', acMode='COOL', rate=1., consumption=1.,
+                         accumulatedConsumption=1.) for _ in range(10)])
+                end.db.session.commit()
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                end.db.session.rollback()
+                errors.append(1)
+            stop.wait(interval)
+
+
+def reader(app, token, stop, latencies, errors):
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            status = client.get('/rooms', headers=headers).status_code
+        except Exception:
+            status = 500
+        if status == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(status)
+
+
+def run(profile, rooms, readers, seconds, interval):
+    with tempfile.TemporaryDirectory() as directory:
+        app = end.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'hotel.db'),
+                              'SQLITE_PROFILE': profile, 'PASSWORD_HASH_ITERATIONS': 1000})
+        token = prepare(app, rooms)
+        stop = threading.Event()
+        reads, read_errors, writes, write_errors = [], [], [], []
+        threads = [threading.Thread(target=writer, args=(app, stop, writes, write_errors, interval))]
+        threads += [threading.Thread(target=reader, args=(app, token, stop, reads, read_errors))
+                    for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        with app.app_context():
+            end.db.engine.dispose()
+    return dict(reads=reads, read_errors=read_errors, writes=writes, write_errors=write_errors)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rooms', type=int, default=200)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.)
+    parser.add_argument('--interval', type=float, default=0.05, help='写事务之间的间隔（秒）')
+    parser.add_argument('--profiles', nargs='+', default=['default', 'wal'])
+    args = parser.parse_args()
+    print(f'{args.rooms} rooms, {args.readers} readers, {args.seconds}s')
+    print(f"{'profile':>12} {'reads':>7} {'read p50':>9} {'read p99':>9} {'errors':>7} "
+          f"{'writes':>7} {'write p50':>10} {'write p99':>10} {'errors':>7}")
+    for profile in args.profiles:
+        result = run(profile, args.rooms, args.readers, args.seconds, args.interval)
+        reads, writes = result['reads'], result['writes']
+        print(f"{profile:>12} {len(reads):>7} {statistics.median(reads) * 1e3 if reads else float('nan'):>8.1f}m "
+              f"{percentile(reads, 0.99) * 1e3:>8.1f}m {len(result['read_errors']):>7} "
+              f"{len(writes):>7} {statistics.median(writes) * 1e3 if writes else float('nan'):>9.1f}m "
+              f"{percentile(writes, 0.99) * 1e3:>9.1f}m {len(result['write_errors']):>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+启动时间基准测试：每次在新的 Python 进程中测量
+    import end / create_app() / init_db() / start_scheduler()
+各阶段的耗时（取多次运行的中位数）
+在仓库根目录运行：
+    python -m benchmarks.bench_startup
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import end
+imported = time.perf_counter()
+app = end.create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1]})
+created = time.perf_counter()
+end.init_db(app)
+initialized = time.perf_counter()
+end.start_scheduler(app)
+started = time.perf_counter()
+end.scheduler.stop()
+print(json.dumps({'import': imported - start, 'create_app': created - imported, 'init_db': initialized - created,
+                  'start_scheduler': started - initialized}))
+'''
+
+
+def run_once(root):
+    with tempfile.TemporaryDirectory() as directory:
+        uri = 'sqlite:///' + os.path.join(directory, 'hotel.db')
+        output = subprocess.run([sys.executable, '-c', PROBE, uri], cwd=root, check=True, capture_output=True,
+                                text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(runs=5):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples = [run_once(root) for _ in range(runs)]
+    print(f"{'phase':>16} {'median (ms)':>12}")
+    total = 0.
+    for phase in samples[0]:
+        median = statistics.median(sample[phase] for sample in samples)
+        total += median
+        print(f'{phase:>16} {median * 1e3:>12.1f}')
+    print(f"{'total':>16} {total * 1e3:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+调度器温度计算的基准测试：逐房间循环 vs NumPy 批量计算
+在仓库根目录运行：
+    python -m benchmarks.bench_thermal
+"""
+import random
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from utils.billing import speed_rates
+from utils.enums import AcMode, FanSpeed, QueueState
+from utils.scheduler_state import SchedulerState
+
+BOOST = 6.
+RATES = speed_rates(1., {FanSpeed.LOW: 0.8, FanSpeed.HIGH: 1.5})  # 各风速的费率，与 Setting.rates 相同的形式
+COOLING_RATE = 0.5 / 60
+DT = 1.
+
+
+def get_speed(fanSpeed):
+    if fanSpeed == FanSpeed.HIGH:
+        return 1.
+    elif fanSpeed == FanSpeed.MEDIUM:
+        return 0.5
+    else:
+        return 1 / 3
+
+
+def minimum(a1, a2):
+    return (a1, 0) if a1 < a2 else (a2, 1)
+
+
+def make_rooms(n, running_ratio=0.1, seed=0):
+    rng = random.Random(seed)
+    rooms = []
+    for roomID in range(1, n + 1):
+        initial = float(rng.randint(15, 35))
+        rooms.append(SimpleNamespace(
+            roomID=roomID, initialTemperature=initial,
+            roomTemperature=initial + rng.choice([0., rng.uniform(-5, 5)]),
+            acTemperature=rng.randint(18, 28), fanSpeed=rng.choice(list(FanSpeed)), acMode=AcMode.COOL,
+            customerSessionID=None,
+            queueState=QueueState.RUNNING if rng.random() < running_ratio else rng.choice(
+                [QueueState.IDLE, QueueState.PENDING]),
+            consumption=0.0, firstRuntime=None))
+    return rooms
+
+
+def reference_step(rooms, dt):
+    # 向量化之前 ACScheduler.update 中的逐房间计算
+    reached = []
+    for room in rooms:
+        if room.queueState == QueueState.RUNNING:
+            if room.roomTemperature > room.acTemperature:
+                delta, argmin = minimum(room.roomTemperature - room.acTemperature,
+                                        get_speed(room.fanSpeed) * dt / 60 * BOOST)
+                if argmin == 0:
+                    reached.append(room)
+                room.roomTemperature -= delta
+                room.consumption += delta * RATES[room.fanSpeed]
+            elif room.roomTemperature < room.acTemperature:
+                delta, argmin = minimum(room.acTemperature - room.roomTemperature,
+                                        get_speed(room.fanSpeed) * dt / 60 * BOOST)
+                if argmin == 0:
+                    reached.append(room)
+                room.roomTemperature += delta
+                room.consumption += delta * RATES[room.fanSpeed]
+            else:
+                reached.append(room)
+    for room in reached:
+        room.queueState = QueueState.PENDING
+    for room in rooms:
+        if room.queueState != QueueState.RUNNING:
+            if room.roomTemperature > room.initialTemperature:
+                room.roomTemperature = max(room.roomTemperature - COOLING_RATE * dt * BOOST, room.initialTemperature)
+            else:
+                room.roomTemperature = min(room.roomTemperature + COOLING_RATE * dt * BOOST, room.initialTemperature)
+    return [room.roomID for room in reached]
+
+
+def vectorized_step(state, dt):
+    reached = state.heat(dt, BOOST, RATES)
+    for roomID in reached:
+        state.get(roomID).queueState = QueueState.PENDING
+    state.drift(dt, BOOST, COOLING_RATE)
+    return reached
+
+
+def check_equivalence(n=2000, ticks=50):
+    rooms = make_rooms(n)
+    state = SchedulerState(get_speed)
+    state.load(make_rooms(n))
+    for _ in range(ticks):
+        assert sorted(reference_step(rooms, DT)) == sorted(vectorized_step(state, DT))
+    temperatures = np.array([room.roomTemperature for room in rooms])
+    consumption = np.array([room.consumption for room in rooms])
+    assert np.array_equal(temperatures, state.roomTemperature[:n])
+    assert np.array_equal(consumption, state.consumption[:n])
+
+
+def timeit(step, target, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        step(target, DT)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    check_equivalence()
+    print('results identical to the per-room loop')
+    print(f"{'rooms':>8} {'loop (ms)':>12} {'numpy (ms)':>12} {'speedup':>8}")
+    for n in (100, 1000, 10000, 100000):
+        repeat = 20 if n <= 10000 else 5
+        rooms = make_rooms(n)
+        state = SchedulerState(get_speed)
+        state.load(make_rooms(n))
+        loop = timeit(reference_step, rooms, repeat)
+        vector = timeit(vectorized_step, state, repeat)
+        print(f'{n:>8} {loop * 1e3:>12.3f} {vector * 1e3:>12.3f} {loop / vector:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+等待队列的基准测试：每次入队重建整个列表 vs 索引优先队列
+在仓库根目录运行：
+    python -m benchmarks.bench_waiting_queue
+"""
+import heapq
+import random
+import time
+
+from utils.waiting_queue import IndexedPriorityQueue
+
+
+def list_queue_ops(n):
+    # 改造之前 ACScheduler 中的等待队列写法
+    queue = []
+    for roomID in range(n):
+        queue = [(priority, random.random(), room_id) for priority, _, room_id in queue]
+        heapq.heappush(queue, (random.randint(1, 3), random.random(), roomID))
+    for roomID in range(0, n, 2):
+        any(id == roomID for _, _, id in queue)
+        queue = [entry for entry in queue if entry[2] != roomID]
+    heapq.heapify(queue)
+    while queue:
+        heapq.heappop(queue)
+
+
+def indexed_queue_ops(n):
+    queue = IndexedPriorityQueue()
+    for roomID in range(n):
+        queue.push(roomID, random.randint(1, 3))
+    for roomID in range(0, n, 2):
+        _ = roomID in queue
+        queue.remove(roomID)
+    for roomID in range(1, n, 4):
+        queue.update(roomID, random.randint(1, 3))
+    while queue:
+        queue.pop()
+
+
+def per_op(step, n):
+    start = time.perf_counter()
+    step(n)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    print(f"{'requests':>9} {'list (us/op)':>14} {'indexed (us/op)':>16}")
+    for n in (100, 1000, 5000, 20000):
+        old = per_op(list_queue_ops, n) if n <= 5000 else float('nan')
+        new = per_op(indexed_queue_ops, n)
+        print(f'{n:>9} {old:>14.2f} {new:>16.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+基准测试套件：调度 tick 耗时与内存分配、开关机命令延迟、房间状态序列化、登录
+按房间数、等待队列深度、并发客户端数扫描，结果以 JSON 输出，并与保存的基线比较，
+任何一项的中位数比基线慢超过 --tolerance 时以退出码 1 结束
+在仓库根目录运行：
+    python -m benchmarks.run --quick                         # 快速扫描，与 benchmarks/baseline.json 比较
+    python -m benchmarks.run --output results.json           # 完整扫描（房间数 10 ~ 50000）
+    python -m benchmarks.run --quick --save-baseline         # 更新基线
+    python -m benchmarks.run --only tick commands            # 只运行部分基准
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import end
+from end import ACScheduler
+from utils.clock import SimulatedClock
+from utils.enums import FanSpeed, Role
+from utils.storage import MemoryStorage
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+FULL = dict(rooms=(10, 100, 1000, 10000, 50000), depths=(0, 10, 100, 1000), clients=(1, 4, 16),
+            snapshot_rooms=(10, 100, 1000, 5000), repeat=50)
+QUICK = dict(rooms=(10, 1000, 10000), depths=(0, 100), clients=(1, 4), snapshot_rooms=(10, 1000), repeat=20)
+
+
+def timings(samples):
+    samples = sorted(samples)
+    return dict(median=statistics.median(samples), p90=samples[min(len(samples) - 1, int(0.9 * len(samples)))],
+                min=samples[0], runs=len(samples))
+
+
+def memory_scheduler(rooms, waiting=0, running=3):
+    """
+    使用内存存储的调度器：rooms 个房间，running 个正在运行，waiting 个在等待队列中
+    """
+    storage = MemoryStorage()
+    for i in range(rooms):
+        storage.add_room(initialTemperature=25. + i % 10, acTemperature=22, fanSpeed=list(FanSpeed)[i % 3])
+    clock = SimulatedClock()
+    scheduler = ACScheduler(storage, clock=clock)
+    scheduler.time_slice = timedelta(days=1)  # 测量期间不发生时间片轮转，队列深度保持不变
+    scheduler.max_num = running
+    for roomID in list(storage.rooms)[:running + waiting]:
+        scheduler.inbox.submit('turn_on', roomID)
+    scheduler.update()
+    return scheduler, clock
+
+
+def bench_tick(config):
+    results = []
+    for rooms in config['rooms']:
+        for depth in config['depths']:
+            if depth + 3 > rooms:
+                continue
+            scheduler, clock = memory_scheduler(rooms, depth)
+            samples = []
+            for _ in range(config['repeat']):
+                clock.advance(1.)
+                start = time.perf_counter()
+                scheduler.update()
+                samples.append(time.perf_counter() - start)
+            # 单次 tick 的内存分配（tracemalloc 会拖慢执行，单独测量）
+            tracemalloc.start()
+            clock.advance(1.)
+            scheduler.update()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append(dict(name=f'tick/rooms={rooms}/waiting={depth}', peakBytes=peak, **timings(samples)))
+    return results
+
+
+def bench_commands(config):
+    # 请求线程提交命令的耗时，以及调度线程一次 tick 中执行一批开关机命令的单条耗时
+    results = []
+    for rooms in config['rooms']:
+        scheduler, clock = memory_scheduler(rooms)
+        roomIDs = list(scheduler.storage.rooms)[:min(rooms, 500)]
+        submit, apply = [], []
+        for _ in range(max(3, config['repeat'] // 5)):
+            for command in ('turn_on', 'turn_off'):
+                start = time.perf_counter()
+                for roomID in roomIDs:
+                    scheduler.inbox.submit(command, roomID)
+                submit.append((time.perf_counter() - start) / len(roomIDs))
+                start = time.perf_counter()
+                scheduler.apply_commands()
+                apply.append((time.perf_counter() - start) / len(roomIDs))
+        results.append(dict(name=f'commands/submit/rooms={rooms}', **timings(submit)))
+        results.append(dict(name=f'commands/apply/rooms={rooms}', **timings(apply)))
+    return results
+
+
+def sql_app(directory):
+    return end.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'hotel.db'),
+                           'PASSWORD_HASH_ITERATIONS': int(os.environ.get('HOTEL_PASSWORD_ITERATIONS', 200_000))})
+
+
+def bench_serialization(config):
+    # get_rooms（所有房间状态，一次查询）和 room_info（单个房间 + 一页详单）
+    results = []
+    for rooms in config['snapshot_rooms']:
+        with tempfile.TemporaryDirectory() as directory:
+            app = sql_app(directory)
+            with app.app_context():
+                end.init_db(app)
+                end.db.session.add_all([end.Room(f'bench-{i}', '', 100, 25, FanSpeed.MEDIUM, end.AcMode.COOL)
+                                        for i in range(rooms)])
+                end.db.session.commit()
+                token = end.db.session.query(end.Account).filter_by(role=Role.manager).first().accountID
+                room = end.db.session.query(end.Room).first()
+                snapshot, info = [], []
+                with app.test_request_context():
+                    for _ in range(max(3, config['repeat'] // 5)):
+                        start = time.perf_counter()
+                        json.dumps(end.get_rooms(token), default=str)
+                        snapshot.append(time.perf_counter() - start)
+                        start = time.perf_counter()
+                        json.dumps(end.room_info(room, require_details=True), default=str)
+                        info.append(time.perf_counter() - start)
+                end.db.engine.dispose()
+        results.append(dict(name=f'serialization/get_rooms/rooms={rooms}', **timings(snapshot)))
+        results.append(dict(name=f'serialization/room_info/rooms={rooms}', **timings(info)))
+    return results
+
+
+def bench_login(config):
+    # 首次登录（计算密码哈希）和重复登录（命中验证缓存），以及并发客户端下的每次登录耗时
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        app = sql_app(directory)
+        with app.app_context():
+            end.init_db(app)
+        data = {'username': '222', 'password': '222', 'role': 'manager'}
+
+        def login(cached):
+            with app.app_context():
+                if not cached:
+                    end.login_cache.clear()
+                start = time.perf_counter()
+                assert end.login(data)
+                return time.perf_counter() - start
+
+        for clients in config['clients']:
+            for cached in (False, True):
+                runs = max(clients * 2, config['repeat'] // (1 if cached else 5))
+                with ThreadPoolExecutor(clients) as executor:
+                    samples = list(executor.map(lambda _: login(cached), range(runs)))
+                kind = 'cached' if cached else 'verify'
+                results.append(dict(name=f'login/{kind}/clients={clients}', **timings(samples)))
+        with app.app_context():
+            end.db.engine.dispose()
+    return results
+
+
+SUITES = {'tick': bench_tick, 'commands': bench_commands, 'serialization': bench_serialization, 'login': bench_login}
+
+
+def compare(results, baseline, tolerance, min_delta):
+    """
+    :param min_delta: 绝对差值小于该值（秒）时视为测量噪声
+    :return: 比基线慢超过 tolerance 的项
+    """
+    previous = {result['name']: result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(result['name'])
+        if old is not None and result['median'] > old['median'] * (1 + tolerance) \
+                and result['median'] - old['median'] > min_delta:
+            regressions.append((result['name'], old['median'], result['median']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quick', action='store_true', help='使用较小的扫描范围')
+    parser.add_argument('--only', nargs='+', choices=list(SUITES), help='只运行这些基准')
+    parser.add_argument('--output', help='结果写入的 JSON 文件')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='允许比基线慢的比例')
+    parser.add_argument('--min-delta', type=float, default=0.5, help='忽略小于该值（毫秒）的变化')
+    args = parser.parse_args()
+
+    config = QUICK if args.quick else FULL
+    results = []
+    for name in args.only or SUITES:
+        print(f'running {name} ...', file=sys.stderr)
+        results += SUITES[name](config)
+    report = dict(python=platform.python_version(), machine=platform.machine(), quick=args.quick, results=results)
+
+    for result in results:
+        print(f"{result['name']:<45} {result['median'] * 1e3:>10.3f} ms  p90 {result['p90'] * 1e3:>10.3f} ms")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2)
+        return
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance, args.min_delta / 1e3)
+        for name, old, new in regressions:
+            print(f'REGRESSION {name}: {old * 1e3:.3f} ms -> {new * 1e3:.3f} ms', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+空调调度仿真：用内存存储和仿真时钟回放一段开关机轨迹，比较不同 max_num 和时间片下的
+吞吐量、等待时间分布和能耗；相同的 --seed 得到相同的结果
+在仓库根目录运行：
+    python -m benchmarks.simulate --rooms 100 --hours 24 --max-num 3 5 8 --time-slice 60 120
+    python -m benchmarks.simulate --trace trace.jsonl          # 回放保存的轨迹
+    python -m benchmarks.simulate --dump-trace trace.jsonl     # 保存生成的轨迹
+"""
+import argparse
+import itertools
+import json
+import random
+from datetime import timedelta
+
+from end import ACScheduler
+from utils.clock import SimulatedClock
+from utils.enums import FanSpeed
+from utils.simulation import Simulation, dump_trace, generate_trace, load_trace
+from utils.storage import MemoryStorage
+
+
+def build_rooms(storage, n, rng):
+    for _ in range(n):
+        storage.add_room(initialTemperature=round(rng.uniform(26, 34), 1), acTemperature=rng.randint(20, 25),
+                         fanSpeed=rng.choice(list(FanSpeed)))
+    return storage.rooms
+
+
+def simulate(args, trace, max_num, time_slice):
+    rng = random.Random(args.seed)  # 每种配置使用相同的房间
+    storage = MemoryStorage()
+    rooms = build_rooms(storage, args.rooms, rng)
+    clock = SimulatedClock()
+    scheduler = ACScheduler(storage, clock=clock)
+    scheduler.boost = 1.  # 仿真时钟就是真实的物理时间
+    scheduler.max_num = max_num
+    scheduler.time_slice = timedelta(seconds=time_slice)
+    return Simulation(scheduler, clock, rooms, trace, tick=args.tick).run(args.hours * 3600)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rooms', type=int, default=100)
+    parser.add_argument('--hours', type=float, default=24.)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tick', type=float, default=1., help='每次调度前进的仿真秒数')
+    parser.add_argument('--max-num', type=int, nargs='+', default=[3])
+    parser.add_argument('--time-slice', type=float, nargs='+', default=[120.], help='时间片（秒）')
+    parser.add_argument('--mean-on', type=float, default=1800., help='平均开机时长（秒）')
+    parser.add_argument('--mean-off', type=float, default=3600., help='平均关机时长（秒）')
+    parser.add_argument('--trace', help='回放的轨迹文件（JSON lines）')
+    parser.add_argument('--dump-trace', help='把生成的轨迹写入文件')
+    parser.add_argument('--json', action='store_true', help='输出完整的 JSON 报告')
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = generate_trace(range(1, args.rooms + 1), args.hours * 3600, random.Random(args.seed + 1),
+                               mean_off=args.mean_off, mean_on=args.mean_on)
+    if args.dump_trace:
+        dump_trace(trace, args.dump_trace)
+
+    reports = [simulate(args, trace, max_num, time_slice)
+               for max_num, time_slice in itertools.product(args.max_num, args.time_slice)]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    print(f'{args.rooms} rooms, {args.hours}h, {len(trace)} events, seed {args.seed}')
+    print(f"{'max_num':>7} {'slice':>6} {'segments':>9} {'util':>5} {'wait p50':>9} {'wait p90':>9} "
+          f"{'wait p99':>9} {'wait max':>9} {'energy':>8} {'speedup':>8}")
+    for report in reports:
+        wait = report['waitSeconds']
+        print(f"{report['maxNum']:>7} {report['timeSlice']:>6.0f} {report['segments']:>9} "
+              f"{report['utilization']:>5.2f} {wait['p50'] or 0:>9.1f} {wait['p90'] or 0:>9.1f} "
+              f"{wait['p99'] or 0:>9.1f} {wait['max'] or 0:>9.1f} {report['energy']:>8.1f} "
+              f"{report['speedup']:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
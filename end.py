@@ -1,46 +1,285 @@
-import heapq
+import atexit
+import csv
+import hashlib
+import hmac
+import io
+import logging
 import random
+import socket
+import threading
 import time
+import traceback
 import uuid
-import threading
+import weakref
+from collections import deque
+from concurrent.futures import Future
 from datetime import datetime, timedelta
 
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, DateTime, Float
-from sqlalchemy.orm import relationship
+import click
+from sqlalchemy import case, func, Column, Integer, String, Enum, ForeignKey, DateTime, Float, Index, and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import backref, relationship
 
+from utils.billing import GRANULARITIES, aggregate, ledger_entries, speed_rates
+from utils.cache import TTLCache
+from utils.clock import SystemClock
+from utils.commands import CommandInbox
 from utils.enums import Role, FanSpeed, AcMode, QueueState
+from utils.events import RoomEventHub, sse_message
+from utils.log_client import LogClient, LogServiceError
+from utils.metrics import Registry
+from utils.passwords import PasswordHasher
+from utils.profiler import SamplingProfiler
+from utils.query_budget import QueryBudgetExceeded, QueryLog, query_budget, timed
+from utils.record_writer import BatchWriter
+from utils.reports import PERIODS, period_range, summarize_usage, usage_deltas
+from utils.scheduler_state import SchedulerState
+from utils.sqlite_profile import PROFILES, engine_options, install_pragmas, is_sqlite
+from utils.ticker import FixedRateLoop, SKIP
+from utils.waiting_queue import IndexedPriorityQueue
 
 import os
-from flask import Flask, abort, request, jsonify, render_template, redirect, url_for, session, Blueprint, send_file
+from flask import Flask, abort, request, jsonify, render_template, redirect, url_for, session, Blueprint, Response, \
+    stream_with_context, current_app, g, has_request_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-import pandas as pd
-import requests
-import json
 
 TIME_EXPIRES = 7  # 7days
-app = Flask(__name__)
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SECRET_KEY'] = os.urandom(24)
-CORS(app)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hotel.db'
-db = SQLAlchemy(app)
+db = SQLAlchemy()
+# 不属于页面蓝图的接口，cli_group=None 使命令行命令注册为 flask 的顶层命令
+api = Blueprint('api', __name__, cli_group=None)
+logger = logging.getLogger(__name__)
+
+
+LEASE_NAME = 'ac-scheduler'
+
+# Prometheus 指标，由 /metrics 导出
+metrics = Registry()
+SCHEDULER_PHASE = metrics.histogram('hotel_scheduler_phase_seconds', '调度每个阶段的耗时', ('phase',))
+REQUEST_LATENCY = metrics.histogram('hotel_http_request_seconds', '请求处理耗时', ('endpoint', 'method', 'status'))
+REQUEST_QUERIES = metrics.histogram('hotel_http_request_queries', '每个请求执行的 SQL 语句数', ('endpoint',),
+                                    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+DB_QUERIES = metrics.counter('hotel_db_queries_total', '执行的 SQL 语句数', ('source',))
+profiler = SamplingProfiler()
+
+
+class SqlStorage:
+    """
+    调度器存储接口的 Flask-SQLAlchemy 实现（内存实现见 utils.storage.MemoryStorage）
+    写操作各自在一个事务内完成
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.app = None  # bind 时绑定的 Flask 应用，调度线程中据此进入应用上下文
+
+    def bind(self, app):
+        self.app = app
+
+    def context(self):
+        return self.app.app_context()
+
+    def rollback(self):
+        self.db.session.rollback()
+
+    def load_rooms(self):
+        return self.db.session.query(Room).all()
+
+    def get_rooms(self, roomIDs):
+        return {room.roomID: room for room in self.db.session.query(Room).filter(Room.roomID.in_(roomIDs))}
+
+    def room_states(self):
+        return self.db.session.query(Room.roomID, Room.roomTemperature, Room.queueState, Room.consumption,
+                                     Room.firstRuntime).all()
+
+    def save_rooms(self, mappings):
+        self.db.session.bulk_update_mappings(Room, mappings)
+        self.db.session.commit()
+
+    def latest_settings(self):
+        return settings_cache.get()
+
+    def insert_records(self, records):
+        # 一次 executemany 批量插入详单，并在同一事务中追加账目、累加会话总额、小时/天费用汇总和报表汇总
+        self.db.session.execute(RoomRecord.__table__.insert(), records)
+        entries = ledger_entries(records)
+        if entries:
+            self.db.session.execute(BillingEntry.__table__.insert(), entries)
+            self.add_to_ledger(*aggregate(entries))
+        self.add_usage(usage_deltas(records))
+        self.db.session.commit()
+
+    def add_usage(self, deltas):
+        for (day, roomID, fanSpeed), (turnOns, servedSeconds, dispatches, energy, fees) in deltas.items():
+            updated = self.db.session.query(UsageRollup).filter_by(day=day, roomID=roomID, fanSpeed=fanSpeed).update(
+                {UsageRollup.turnOns: UsageRollup.turnOns + turnOns,
+                 UsageRollup.servedSeconds: UsageRollup.servedSeconds + servedSeconds,
+                 UsageRollup.dispatches: UsageRollup.dispatches + dispatches,
+                 UsageRollup.energy: UsageRollup.energy + energy, UsageRollup.fees: UsageRollup.fees + fees},
+                synchronize_session=False)
+            if not updated:
+                self.db.session.add(UsageRollup(day, roomID, fanSpeed, turnOns, servedSeconds, dispatches, energy,
+                                                fees))
+
+    def usage(self, start, end, roomID=None):
+        # [start, end) 内每天、每个房间、每种风速的汇总行
+        query = self.db.session.query(UsageRollup).filter(UsageRollup.day >= start, UsageRollup.day < end)
+        if roomID is not None:
+            query = query.filter(UsageRollup.roomID == roomID)
+        return query.all()
+
+    def add_to_ledger(self, totals, rollups):
+        # 每个会话、每个汇总行只执行一条 UPDATE，行不存在时插入
+        for sessionID, (roomID, energy, amount, entries) in totals.items():
+            updated = self.db.session.query(BillingTotal).filter_by(customerSessionID=sessionID).update(
+                {BillingTotal.energy: BillingTotal.energy + energy, BillingTotal.amount: BillingTotal.amount + amount,
+                 BillingTotal.entries: BillingTotal.entries + entries, BillingTotal.updateTime: datetime.now()},
+                synchronize_session=False)
+            if not updated:
+                self.db.session.add(BillingTotal(sessionID, roomID, energy, amount, entries))
+        for (granularity, periodStart, roomID), (energy, amount, entries) in rollups.items():
+            updated = self.db.session.query(BillingRollup).filter_by(
+                granularity=granularity, periodStart=periodStart, roomID=roomID
+            ).update({BillingRollup.energy: BillingRollup.energy + energy,
+                      BillingRollup.amount: BillingRollup.amount + amount,
+                      BillingRollup.entries: BillingRollup.entries + entries}, synchronize_session=False)
+            if not updated:
+                self.db.session.add(BillingRollup(granularity, periodStart, roomID, energy, amount, entries))
+
+    def billing_total(self, sessionID):
+        return self.db.session.get(BillingTotal, sessionID)
+
+    def billing_totals(self, sessionIDs):
+        # 一次查询多个会话的总额（批量退房）
+        return {total.customerSessionID: total for total in
+                self.db.session.query(BillingTotal).filter(BillingTotal.customerSessionID.in_(sessionIDs))}
+
+    def revenue(self, granularity, start=None, end=None, roomID=None):
+        # 按小时/天汇总的费用，[start, end) 按汇总区间的起点过滤
+        query = self.db.session.query(BillingRollup).filter(BillingRollup.granularity == granularity)
+        if start is not None:
+            query = query.filter(BillingRollup.periodStart >= start)
+        if end is not None:
+            query = query.filter(BillingRollup.periodStart < end)
+        if roomID is not None:
+            query = query.filter(BillingRollup.roomID == roomID)
+        return query.order_by(BillingRollup.periodStart, BillingRollup.roomID).all()
+
+    def query_records(self, roomID=None, sessionID=None, start=None, end=None, after=None, limit=100):
+        """
+        按房间或入住会话查询详单，可限定服务开始时间范围 [start, end)
+        按 (serveStartTime, id) 排序，after 为上一页最后一条的 (serveStartTime, id)，每页都走索引
+        """
+        query = self.db.session.query(RoomRecord)
+        if sessionID is not None:
+            query = query.filter(RoomRecord.customSessionID == sessionID)
+        else:
+            query = query.filter(RoomRecord.roomID == roomID)
+        if start is not None:
+            query = query.filter(RoomRecord.serveStartTime >= start)
+        if end is not None:
+            query = query.filter(RoomRecord.serveStartTime < end)
+        if after is not None:
+            serveStartTime, record_id = after
+            query = query.filter(or_(RoomRecord.serveStartTime > serveStartTime,
+                                     and_(RoomRecord.serveStartTime == serveStartTime, RoomRecord.id > record_id)))
+        return query.order_by(RoomRecord.serveStartTime, RoomRecord.id).limit(limit).all()
+
+    def session_records(self, sessionID, batch_size=500):
+        # 按批从数据库游标读取，内存占用与记录条数无关
+        return self.db.session.query(RoomRecord).filter(RoomRecord.customSessionID == sessionID) \
+            .order_by(RoomRecord.serveStartTime, RoomRecord.id).yield_per(batch_size)
+
+    def push_commands(self, commands):
+        # 一次 executemany 写入（逐个 add 时每行一条带 RETURNING 的 INSERT）
+        now = datetime.now()
+        self.db.session.execute(SchedulerCommand.__table__.insert(),
+                                [dict(roomID=roomID, command=command, createTime=now) for roomID, command in commands])
+        self.db.session.commit()
+
+    def take_commands(self, limit):
+        return [(command.id, command.command, command.roomID) for command in
+                self.db.session.query(SchedulerCommand).order_by(SchedulerCommand.id).limit(limit)]
+
+    def delete_commands(self, last_id):
+        self.db.session.query(SchedulerCommand).filter(SchedulerCommand.id <= last_id).delete(
+            synchronize_session=False)
+        self.db.session.commit()
+
+    def acquire_lease(self, name, holder, ttl):
+        """
+        获取或续约租约：租约不存在、已过期或本来就属于 holder 时成功
+        :return: holder 是否持有租约
+        """
+        now = datetime.now()
+        expiresAt = now + timedelta(seconds=ttl)
+        updated = self.db.session.query(SchedulerLease).filter(
+            SchedulerLease.name == name, or_(SchedulerLease.holder == holder, SchedulerLease.expiresAt < now)
+        ).update({SchedulerLease.holder: holder, SchedulerLease.expiresAt: expiresAt}, synchronize_session=False)
+        if updated:
+            self.db.session.commit()
+            return True
+        if self.db.session.query(SchedulerLease.name).filter_by(name=name).first() is not None:
+            self.db.session.rollback()
+            return False
+        self.db.session.add(SchedulerLease(name, holder, expiresAt))
+        try:
+            self.db.session.commit()
+            return True
+        except IntegrityError:  # 其他进程同时创建了租约
+            self.db.session.rollback()
+            return False
+
+    def release_lease(self, name, holder):
+        self.db.session.query(SchedulerLease).filter_by(name=name, holder=holder).update(
+            {SchedulerLease.expiresAt: datetime.now()}, synchronize_session=False)
+        self.db.session.commit()
 
 
 class ACScheduler:
-    def __init__(self, db, interval=1):
+    def __init__(self, storage, interval=1, flush_interval=10, tick_policy=SKIP, lease_ttl=10, clock=None):
         # 初始化空调调度器
-        self.db = db  # 数据库连接
+        self.storage = storage  # 房间、详单、命令、租约的存储（SqlStorage 或 utils.storage.MemoryStorage）
+        self.clock = clock or SystemClock()  # 时间来源，仿真时使用 utils.clock.SimulatedClock
         self.interval = interval  # 调度更新时间间隔（以秒为单位）
+        self.tick_policy = tick_policy  # 调度落后时跳过（SKIP）还是补跑（CATCH_UP）
+        self.loop = None  # 调度线程
+        # 多进程部署时通过数据库租约选出唯一的主调度器，其余进程把开关机等命令写入命令表转发给它
+        self.node_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.lease_ttl = lease_ttl  # 租约有效期（秒），主调度器每 lease_ttl / 3 秒续约一次
+        self.lease_checked = float('-inf')  # 上次获取/续约租约的时间（time.monotonic）
+        self.lease_deadline = float('-inf')  # 当前租约在本进程看来的到期时间（time.monotonic）
+        self.is_leader = False
+        # 请求线程只把开关机等命令放入命令队列，由调度线程在每次调度开始时执行，调度器内部状态只由调度线程修改
+        self.inbox = CommandInbox()
+        self.published = {}  # 非主调度器推送时，每个房间上次推送的状态
+        self.publisher = None  # 没有运行调度线程的 Web 进程中的推送线程
+        self.publisher_lock = threading.Lock()
+        self.flush_interval = flush_interval  # 内存状态写回数据库的间隔（以秒为单位）
         self.max_num = 3  # 最大同时运行的空调数量
-        self.running_list = []  # 正在运行的空调列表
-        self.waiting_queue = []  # 等待队列，存放等待运行的空调
-        self.last_update = time.time()  # 上次调度更新时间
+        self.time_slice = timedelta(minutes=2)  # 时间片长度（未经 boost 缩放），用完后回到等待队列
+        self.running_list = {}  # 正在运行的空调（roomID -> None，保持调度顺序）
+        self.waiting_queue = IndexedPriorityQueue()  # 等待队列，按优先级和入队顺序出队
+        self.last_update = self.clock.time()  # 上次调度更新时间
+        self.last_flush = self.clock.time()  # 上次写回数据库的时间
+        self.flush_now = False  # 执行了 reset 命令，本次调度结束时立即写回
         self.cooling_rate = 0.5 / 60  # 房间回温速率（每分钟）
-        self.rate = 1.  # 空调费率（每单位温度改变的费用）
+        self.rates = speed_rates(1.)  # 各风速的费率（每单位温度改变的费用），每次调度从当前设置读取
 
         self.boost = 6.  # 空调性能提升系数
 
+        # 调度器持有的房间状态（列式存放），每次调度只修改内存，按 flush_interval 批量写回
+        self.state = SchedulerState(self.get_speed)
+        # 房间温度、队列状态的推送，每次调度后只分发一次
+        self.events = RoomEventHub()
+
+        # 详单：正在服务的时间段（roomID -> 开始服务时的信息），服务结束时交给后台线程批量写入
+        self.request_times = {}  # roomID -> 请求（进入等待队列）时间
+        self.segments = {}  # roomID -> (requestTime, serveStartTime, 开始服务时的累计费用, 累计能耗)
+        self.turned_on = set()  # 开机后还没有产生详单的房间，下一条详单计入开机次数
+        self.records = BatchWriter(self.write_records, name='room-records')
+        self.record_backlog = deque()  # 写入队列已满时暂存，下次调度时重新提交
+
     def minimum(self, a1, a2):
         # 返回两个数的最小值和索引（0表示第一个数最小，1表示第二个数最小）
         return (a1, 0) if a1 < a2 else (a2, 1)
@@ -56,114 +295,429 @@ class ACScheduler:
 
     def get_priority(self, acSpeed):
         # 根据空调速度返回优先级（高速度优先级最低）
+        # FanSpeed 的值是大写的，所有房间的优先级都是 3，等待队列实际按入队顺序（FIFO）调度；
+        # 按风速区分优先级会让低风速的房间饿死，修改调度策略前需要先加入老化机制
         return {'high': 1, 'medium': 2, 'low': 3}.get(acSpeed.value, 3)
 
-    def add_to_waiting(self, room):
+    def ensure_loaded(self):
+        # 第一次使用时从数据库载入全部房间，并恢复上次进程遗留的运行/等待状态
+        if self.state.loaded:
+            return
+        self.state.load(self.storage.load_rooms())
+        for state in self.state.views():
+            if state.queueState == QueueState.RUNNING:
+                self.running_list[state.roomID] = None
+                serveStartTime = state.firstRuntime or self.clock.now()
+                self.segments[state.roomID] = (serveStartTime, serveStartTime, state.consumption, state.energy)
+            elif state.queueState == QueueState.PENDING:
+                self.waiting_queue.push(state.roomID, self.get_priority(state.fanSpeed))
+
+    def add_to_waiting(self, state):
         # 将房间添加到等待队列中
-        room.queueState = QueueState.PENDING
-        db.session.commit()
-        # 将房间信息添加到等待队列，并根据优先级和随机值排序
-        self.waiting_queue = [(priority, random.random(), room_id) for priority, random_val, room_id in
-                              self.waiting_queue]
-        heapq.heappush(self.waiting_queue, (self.get_priority(room.fanSpeed), random.random(), room.roomID))
-        if room.roomID in self.running_list:
-            self.running_list.remove(room.roomID)
-        # 在这里产生详单记录（未提供代码示例）
+        self.end_segment(state)
+        state.queueState = QueueState.PENDING
+        self.request_times[state.roomID] = self.clock.now()
+        # 将房间信息添加到等待队列，优先级相同的按入队顺序排列
+        self.waiting_queue.push(state.roomID, self.get_priority(state.fanSpeed))
+        self.running_list.pop(state.roomID, None)
+
+    def begin_segment(self, state):
+        # 房间被调度为 RUNNING，开始一段服务
+        now = self.clock.now()
+        self.segments[state.roomID] = (self.request_times.pop(state.roomID, now), now, state.consumption, state.energy)
+
+    def end_segment(self, state):
+        # 房间离开 RUNNING，产生一条详单记录（不在调度线程中写数据库）
+        segment = self.segments.pop(state.roomID, None)
+        if segment is None:
+            return
+        requestTime, serveStartTime, startConsumption, startEnergy = segment
+        self.submit_record(dict(roomID=state.roomID, customSessionID=state.customerSessionID,
+                                requestTime=requestTime, serveStartTime=serveStartTime, serveEndTime=self.clock.now(),
+                                fanSpeed=state.fanSpeed.value, acMode=state.acMode.value if state.acMode else None,
+                                rate=self.rates[state.fanSpeed], consumption=state.consumption - startConsumption,
+                                energy=state.energy - startEnergy, accumulatedConsumption=state.consumption,
+                                turnedOn=state.roomID in self.turned_on))
+        self.turned_on.discard(state.roomID)
+
+    def submit_record(self, record):
+        if self.record_backlog or not self.records.submit(record):
+            self.record_backlog.append(record)
+
+    def resubmit_records(self):
+        while self.record_backlog and self.records.submit(self.record_backlog[0]):
+            self.record_backlog.popleft()
+
+    def refresh_rates(self):
+        # 设置有缓存，只有设置被修改或缓存过期时才查询数据库
+        settings = self.storage.latest_settings()
+        if settings is not None:
+            self.rates = settings.rates
+
+    def write_records(self, records):
+        # 后台线程中调用：一次 executemany 批量插入详单
+        with self.storage.context():
+            self.storage.insert_records(records)
 
     def update(self):
         # 更新空调调度状态
-        with app.app_context():
-            t = time.time()
-
-            rooms = self.db.session.query(Room).all()
-            for room in rooms:
-                if room.queueState == QueueState.RUNNING:  # 空调开启时
-                    if room.roomTemperature > room.acTemperature:  # 制冷
-                        delta, argmin = self.minimum(room.roomTemperature - room.acTemperature,
-                                                     self.get_speed(room.fanSpeed) * (
-                                                             t - self.last_update) / 60 * self.boost)
-                        if argmin == 0:
-                            self.add_to_waiting(room)
-                        room.roomTemperature -= delta
-                        room.consumption += delta * self.rate
-                        db.session.commit()
-                    elif room.roomTemperature < room.acTemperature:  # 制热
-                        delta, argmin = self.minimum(room.acTemperature - room.roomTemperature,
-                                                     self.get_speed(room.fanSpeed) * (
-                                                             t - self.last_update) / 60 * self.boost)
-                        if argmin == 0:
-                            self.add_to_waiting(room)
-                        room.roomTemperature += delta
-                        room.consumption += delta * self.rate
-                        db.session.commit()
-                    else:
-                        self.add_to_waiting(room)  # 达到目标温度回到等待队列
-            # print(self.running_list, self.waiting_queue)
-
-            for roomID in self.running_list:
-                room = db.session.query(Room).filter_by(roomID=roomID).one()
-                # print(datetime.now() - room.firstRuntime)
-                if datetime.now() - room.firstRuntime > timedelta(minutes=2) / self.boost:  # 2分钟 / 6（性能提升系数）
-                    print('over time!')
-                    self.add_to_waiting(room)
-
-            for room in rooms:
-                if room.queueState != QueueState.RUNNING:  # 空调关闭时
-                    if room.roomTemperature > room.initialTemperature:  # 房间的回温逻辑
-                        room.roomTemperature = max(
-                            room.roomTemperature - self.cooling_rate * (t - self.last_update) * self.boost,
-                            room.initialTemperature)
-                    else:
-                        room.roomTemperature = min(
-                            room.roomTemperature + self.cooling_rate * (t - self.last_update) * self.boost,
-                            room.initialTemperature)
-                    db.session.commit()
-
-            while self.waiting_queue and len(self.running_list) < self.max_num:
-                _, _, roomID = heapq.heappop(self.waiting_queue)
-                room = self.db.session.query(Room).filter_by(roomID=roomID).one()
-                room.queueState = QueueState.RUNNING
-                room.firstRuntime = datetime.now()
-                db.session.commit()
-                self.running_list.append(roomID)
+        with self.storage.context():
+            with SCHEDULER_PHASE.time('commands'):
+                self.ensure_loaded()
+                self.apply_commands()
+                self.resubmit_records()
+            t = self.clock.time()
+            self.refresh_rates()
+
+            # 所有运行中的房间批量制冷/制热，按各自风速的费率计费，达到目标温度的回到等待队列
+            with SCHEDULER_PHASE.time('thermal'):
+                for roomID in self.state.heat(t - self.last_update, self.boost, self.rates):
+                    self.add_to_waiting(self.state.get(roomID))
+
+            with SCHEDULER_PHASE.time('timeslice'):
+                for roomID in list(self.running_list):
+                    state = self.state.get(roomID)
+                    if self.clock.now() - state.firstRuntime > self.time_slice / self.boost:  # 2分钟 / 6（性能提升系数）
+                        logger.debug('room %s used up its time slice', roomID)
+                        self.add_to_waiting(state)
+
+            # 空调关闭时，所有房间批量回温
+            with SCHEDULER_PHASE.time('drift'):
+                self.state.drift(t - self.last_update, self.boost, self.cooling_rate)
+
+            with SCHEDULER_PHASE.time('dispatch'):
+                while self.waiting_queue and len(self.running_list) < self.max_num:
+                    roomID, _ = self.waiting_queue.pop()
+                    state = self.state.get(roomID)
+                    if state is None:  # 房间已被删除
+                        continue
+                    state.queueState = QueueState.RUNNING
+                    state.firstRuntime = self.clock.now()
+                    self.running_list[roomID] = None
+                    self.begin_segment(state)
 
             self.last_update = t
+            with SCHEDULER_PHASE.time('publish'):
+                self.publish()
+            if self.flush_now or t - self.last_flush >= self.flush_interval:
+                with SCHEDULER_PHASE.time('flush'):
+                    self.flush()
+
+    def time_left(self, firstRuntime, now):
+        # 当前时间片的剩余比例
+        return (now - firstRuntime) / self.time_slice * self.boost if firstRuntime is not None else None
+
+    def publish(self):
+        # 把自上次推送后变化的房间推送给订阅者
+        changes = self.state.pop_changes()
+        if not changes or not self.events.has_subscribers():
+            return
+        now = self.clock.now()
+        self.events.publish([dict(roomID=state.roomID, roomTemperature=state.roomTemperature,
+                                  queueState=state.queueState.value, consumption=state.consumption,
+                                  timeLeft=self.time_left(state.firstRuntime, now)) for state in changes])
+
+    def tick(self):
+        # 调度线程每次调用：持有租约时执行调度，否则只推送数据库中的房间状态
+        with self.storage.context():
+            if self.hold_lease():
+                self.update()
+            else:
+                self.forward_commands()
+                self.publish_from_db()
+
+    def hold_lease(self):
+        now = time.monotonic()
+        if now - self.lease_checked < self.lease_ttl / 3:
+            return self.is_leader
+        self.lease_checked = now
+        try:
+            leader = self.storage.acquire_lease(LEASE_NAME, self.node_id, self.lease_ttl)
+        except Exception:
+            self.storage.rollback()
+            traceback.print_exc()
+            leader = self.is_leader and now < self.lease_deadline  # 暂时无法续约时，租约未到期前仍然有效
+        if leader:
+            self.lease_deadline = now + self.lease_ttl
+        if leader and not self.is_leader:
+            self.become_leader()
+        elif not leader and self.is_leader:
+            self.step_down()
+        return self.is_leader
+
+    def become_leader(self):
+        # 成为主调度器：丢弃内存状态，下次调度时从数据库重新载入（上一任已写回）
+        logger.info('scheduler leader: %s', self.node_id)
+        self.clear()
+        self.is_leader = True
+
+    def step_down(self):
+        # 租约被其他进程取得：不再写回，房间状态已归新的主调度器所有
+        logger.warning('scheduler lost leadership: %s', self.node_id)
+        self.clear()
+        self.is_leader = False
+
+    def clear(self):
+        self.state = SchedulerState(self.get_speed)
+        self.running_list = {}
+        self.waiting_queue = IndexedPriorityQueue()
+        self.request_times = {}
+        self.segments = {}
+        self.last_update = self.clock.time()
+        self.last_flush = self.clock.time()
+
+    def submit(self, command, roomID):
+        """
+        请求线程调用：提交一条命令（turn_on / turn_off / sync / reset / forget），立即返回
+        本进程没有运行调度线程时直接写入命令表，由主调度器执行
+        :return: 命令的 Future，执行后结果为房间的队列状态（转发给其他进程时为 None）；命令队列已满时返回 None
+        """
+        assert command == 'forget' or command in COMMANDS, f'unknown command {command}'
+        if self.loop is None or not self.loop.is_alive():
+            self.storage.push_commands([(roomID, command)])
+            future = Future()
+            future.set_result(None)
+            return future
+        return self.inbox.submit(command, roomID)
+
+    def submit_many(self, commands):
+        """
+        批量提交 [(command, roomID)]（批量入住、退房），命令队列放不下的部分在一个事务内写入命令表，不会丢失
+        :return: 每条命令的 Future
+        """
+        futures, overflow = [], []
+        alive = self.loop is not None and self.loop.is_alive()
+        for command, roomID in commands:
+            assert command == 'forget' or command in COMMANDS, f'unknown command {command}'
+            future = self.inbox.submit(command, roomID) if alive else None
+            if future is None:
+                overflow.append((roomID, command))
+                future = Future()
+                future.set_result(None)
+            futures.append(future)
+        if overflow:
+            self.storage.push_commands(overflow)
+        return futures
+
+    def forward_commands(self):
+        # 本进程不是主调度器：把命令队列中的命令在一个事务内写入命令表，由主调度器在下一次调度时执行
+        commands = self.inbox.take()
+        if not commands:
+            return
+        self.storage.push_commands([(command.roomID, command.name) for command in commands])
+        for command in commands:
+            command.future.set_result(None)
+
+    def apply_commands(self, limit=1000):
+        # 主调度器批量执行其他进程转发来的命令（执行后删除）和本进程命令队列中的命令
+        stored = self.storage.take_commands(limit)
+        commands = [(command, roomID, None) for _, command, roomID in stored]
+        commands += [(command.name, command.roomID, command.future) for command in self.inbox.take(limit)]
+        if not commands:
+            return
+        roomIDs = {roomID for _, roomID, _ in commands}
+        rooms = self.storage.get_rooms(roomIDs)
+        # 入住、退房提交后到 reset 执行前的写回可能把旧的运行状态写回了行，本次调度结束时立即以重置后的状态覆盖
+        self.flush_now |= any(name == 'reset' for name, _, _ in commands)
+        for name, roomID, future in commands:
+            try:
+                room = rooms.get(roomID)
+                if name == 'forget' or room is None:
+                    self.forget_room(roomID)
+                else:
+                    getattr(self, COMMANDS[name])(room)
+                state = self.state.get(roomID)
+                result = state.queueState if state is not None else None
+            except Exception as e:
+                if future is None:
+                    traceback.print_exc()
+                else:
+                    future.set_exception(e)
+            else:
+                if future is not None:
+                    future.set_result(result)
+        if stored:
+            self.storage.delete_commands(stored[-1][0])
+
+    def publish_from_db(self):
+        # 非主调度器的进程：有推送订阅者时每次调度查询一次房间状态，把变化推送给本进程的订阅者
+        if not self.events.has_subscribers():
+            return
+        now = self.clock.now()
+        deltas = []
+        for row in self.storage.room_states():
+            key = (row.roomTemperature, row.queueState, row.consumption, row.firstRuntime)
+            if self.published.get(row.roomID) != key:
+                self.published[row.roomID] = key
+                deltas.append(dict(roomID=row.roomID, roomTemperature=row.roomTemperature,
+                                   queueState=row.queueState.value, consumption=row.consumption,
+                                   timeLeft=self.time_left(row.firstRuntime, now)))
+        self.events.publish(deltas)
+
+    def start_publisher(self, app=None):
+        """
+        推送连接建立时调用：本进程只处理 Web 请求、没有运行调度线程时（gunicorn 工作进程 + 独立的 run-scheduler），
+        启动推送线程，按调度频率读取数据库中的房间状态，把变化推送给本进程的订阅者
+        """
+        with self.publisher_lock:
+            if self.publisher is not None and self.publisher.is_alive():
+                return
+            if app is not None:
+                self.storage.bind(app)
+            self.publisher = FixedRateLoop(self.interval, self.publish_tick, name='room-publisher')
+            self.publisher.start()
+
+    def publish_tick(self):
+        # 推送线程每次调用：本进程运行调度线程时由 tick 推送；没有订阅者时不查询数据库
+        if self.loop is not None and self.loop.is_alive() or not self.events.has_subscribers():
+            return
+        with self.storage.context():
+            self.publish_from_db()
+
+    def flush(self):
+        # 将内存中被修改过的房间在一个事务内批量写回数据库
+        with self.storage.context():
+            mappings = self.state.pop_dirty()
+            if mappings:
+                self.storage.save_rooms(mappings)
+            self.last_flush = self.clock.time()
+            self.flush_now = False
+
+    def sync_room(self, room):
+        # 房间配置被修改（或新建房间）后同步到调度器，风速改变时调整等待队列中的优先级
+        self.ensure_loaded()
+        state = self.state.get(room.roomID)
+        # 运行中的房间改变风速：在旧风速下结束一段服务、开始新的一段，每条详单只有一种风速
+        split = state is not None and room.roomID in self.running_list and state.fanSpeed != room.fanSpeed
+        if split:
+            self.end_segment(state)
+        state = self.state.upsert(room)
+        if split:
+            self.begin_segment(state)
+        if room.roomID in self.waiting_queue:
+            self.waiting_queue.update(room.roomID, self.get_priority(room.fanSpeed))
+        return state
+
+    def reset_room(self, room):
+        # 入住、退房时房间状态被重置，移出运行列表和等待队列
+        self.ensure_loaded()
+        state = self.state.get(room.roomID)
+        if state is not None:
+            self.end_segment(state)
+        self.remove_from_queues(room.roomID)
+        return self.state.reset(room)
+
+    def forget_room(self, roomID):
+        # 房间被删除
+        self.remove_from_queues(roomID)
+        self.segments.pop(roomID, None)
+        self.state.remove(roomID)
+
+    def remove_from_queues(self, roomID):
+        self.running_list.pop(roomID, None)
+        self.waiting_queue.remove(roomID)
+        self.request_times.pop(roomID, None)
+        self.turned_on.discard(roomID)  # 关机前没有得到服务的开机不计数
+
+    def live(self, room):
+        # 返回房间的实时状态（调度器内存中的状态优先于数据库中的行）
+        state = self.state.get(room.roomID)
+        return room if state is None else state
 
     def turn_off(self, room):
         # 将房间的状态从PENDING/RUNNING切换到IDLE（关闭空调）
-        room.queueState = QueueState.IDLE
-        db.session.commit()
-        if room.roomID in self.running_list:
-            self.running_list.remove(room.roomID)
-        self.waiting_queue = [(priority, random_value, roomID) for priority, random_value, roomID in self.waiting_queue
-                              if roomID != room.roomID]
-        # 在这里产生详单记录（未提供代码示例）
-        print('turn off!', room.queueState, self.running_list, self.waiting_queue)
+        state = self.sync_room(room)
+        self.end_segment(state)
+        state.queueState = QueueState.IDLE
+        self.remove_from_queues(state.roomID)
+        logger.debug('turn off %s: running %s, waiting %s', state.roomID, list(self.running_list), self.waiting_queue)
 
     def turn_on(self, room):
         # 将房间的状态从IDLE切换到PENDING（打开空调）
-        in_waiting = False
-        for p, random_value, id, in self.waiting_queue:
-            if id == room.roomID:
-                in_waiting = True
-
-        if room.roomID not in self.running_list and not in_waiting:
-            self.add_to_waiting(room)
-        print('turn on!', room.queueState, self.running_list, self.waiting_queue)
-
-    def schedule_wrapper(self):
-        try:
-            self.update()  # 调用 调度函数
-        finally:
-            # 安排下一次执行
-            threading.Timer(self.interval, self.schedule_wrapper).start()
-
-    def start(self):
-        threading.Timer(self.interval, self.schedule_wrapper).start()
+        state = self.sync_room(room)
+        if state.roomID not in self.running_list and state.roomID not in self.waiting_queue:
+            self.turned_on.add(state.roomID)
+            self.add_to_waiting(state)
+        logger.debug('turn on %s: running %s, waiting %s', state.roomID, list(self.running_list), self.waiting_queue)
+
+    def start(self, app=None):
+        # 启动唯一的调度线程，按固定频率调用 tick；使用内存存储时不需要 app
+        if self.loop is not None and self.loop.is_alive():
+            return
+        if app is not None:
+            self.storage.bind(app)
+            self.flush_interval = app.config.get('SCHEDULER_FLUSH_INTERVAL', self.flush_interval)
+            self.lease_ttl = app.config.get('SCHEDULER_LEASE_TTL', self.lease_ttl)
+        self.loop = FixedRateLoop(self.interval, self.tick, policy=self.tick_policy, name='ac-scheduler')
+        self.records.start()
+        self.loop.start()
+        atexit.register(self.stop)  # 进程退出时停止调度并写回尚未落盘的状态
+
+    def stop(self, timeout=None):
+        # 停止调度线程，等待当前这次调度结束后写回内存状态
+        if self.publisher is not None:
+            self.publisher.stop()
+        if self.loop is None:
+            return
+        self.loop.stop()
+        self.loop.join(timeout)
+        if self.is_leader:
+            self.flush()
+            with self.storage.context():
+                self.storage.release_lease(LEASE_NAME, self.node_id)
+            self.is_leader = False
+        with self.storage.context():
+            self.forward_commands()  # 尚未执行的命令交给下一任主调度器
+        for record in self.record_backlog:
+            self.records.submit(record)
+        self.record_backlog.clear()
+        self.records.stop(timeout)
+
+    def join(self, timeout=None):
+        if self.loop is not None:
+            self.loop.join(timeout)
+
+    def stats(self):
+        # 调度耗时、延迟、落后次数等指标
+        stats = self.loop.stats.as_dict() if self.loop is not None else {}
+        stats.update(running=len(self.running_list), waiting=len(self.waiting_queue), rooms=len(self.state),
+                     interval=self.interval, policy=self.tick_policy, records=self.records.stats(),
+                     commands=self.inbox.stats(),
+                     recordBacklog=len(self.record_backlog), leader=self.is_leader, node=self.node_id)
+        return stats
+
+
+# 命令名 -> 调度线程中执行的方法
+COMMANDS = {'turn_on': 'turn_on', 'turn_off': 'turn_off', 'sync': 'sync_room', 'reset': 'reset_room'}
+
+storage = SqlStorage(db)
+scheduler = ACScheduler(storage)
+
+# 队列深度等在导出时读取
+metrics.gauge('hotel_scheduler_running', '正在运行的空调数', callback=lambda: len(scheduler.running_list))
+metrics.gauge('hotel_scheduler_waiting', '等待队列长度', callback=lambda: len(scheduler.waiting_queue))
+metrics.gauge('hotel_scheduler_inbox', '命令队列中尚未执行的命令数', callback=lambda: len(scheduler.inbox))
+metrics.gauge('hotel_scheduler_records_pending', '等待写入的详单数',
+              callback=lambda: scheduler.records.pending() + len(scheduler.record_backlog))
+metrics.gauge('hotel_scheduler_leader', '本进程是否为主调度器', callback=lambda: int(scheduler.is_leader))
+metrics.gauge('hotel_sse_subscribers', '推送连接数', callback=lambda: len(scheduler.events))
+metrics.gauge('hotel_scheduler_lag_seconds', '最近一次调度的延迟',
+              callback=lambda: scheduler.loop.stats.last_lag if scheduler.loop is not None else 0.)
+
+
+def submit_command(command, roomID):
+    """
+    请求处理函数向调度器提交命令，不等待执行；需要执行结果时调用返回的 future.result(timeout)
+    调度器命令队列已满时返回 503
+    """
+    future = scheduler.submit(command, roomID)
+    if future is None:
+        abort(503, "scheduler is busy, please retry later")
+    return future
 
 
-scheduler = ACScheduler(db)
-scheduler.start()
+# 密码哈希的 cost 由配置 PASSWORD_HASH_ITERATIONS 决定，在 create_app 中设置
+password_hasher = PasswordHasher()
 
 
 class Account(db.Model):
@@ -178,15 +732,15 @@ class Account(db.Model):
     phoneNumber = Column(String, nullable=True)
 
     createTime = Column(DateTime, nullable=False)
-    room = relationship('Room', backref='accounts')
+    room = relationship('Room', backref=backref('accounts', passive_deletes=True))
 
     def __init__(self, username: str, password: str, role: Role, roomID: int = None, idCard: str = None,
                  phoneNumber: str = None):
         """
-        登记入住、创建共享帐号
+        登记入住、创建共享帐号（批量入住见 check_in_many）
         """
         self.username = username
-        self.password = password
+        self.password = password_hasher.hash(str(password))  # 只保存哈希
         self.role = role
 
         assert not (role == Role.customer and roomID is None), "客户帐号在创建时必须指定房间ID"
@@ -219,7 +773,7 @@ class Room(db.Model):
     # 房间的全部记录，管理员可见
     # 用户可见的部分是与当前房间customerSessionID相同的部分
     # 也可以通过与身份证号相同的部分查看历史记录
-    records = relationship('RoomRecord', backref='room')
+    records = relationship('RoomRecord', backref='room', passive_deletes=True)  # 删除房间时由 delete_room 处理详单
 
     def __init__(self, roomName: str, roomDescription: str, unitPrice: float, acTemperature: int, fanSpeed: FanSpeed,
                  acMode: AcMode, initialTemperature: float = None):
@@ -249,6 +803,10 @@ class Room(db.Model):
 
 class RoomRecord(db.Model):
     __tablename__ = 'room_records'
+    # 详单总是按房间或入住会话、再按时间范围查询；保留期清理按时间查询
+    __table_args__ = (Index('ix_room_records_room_start', 'roomID', 'serveStartTime'),
+                      Index('ix_room_records_session_start', 'customSessionID', 'serveStartTime'),
+                      Index('ix_room_records_start', 'serveStartTime'))
     id = Column(Integer, primary_key=True)
     roomID = Column(Integer, ForeignKey('room.roomID'))
     customSessionID = Column(String)
@@ -265,7 +823,7 @@ class RoomRecord(db.Model):
     def __init__(self, roomID, customerSessionID, requestTime, serveStartTime, serveEndTime, fanSpeed, acMode, rate,
                  consumption, accumulatedConsumption):
         self.roomID = roomID
-        self.customerSessionID = customerSessionID
+        self.customSessionID = customerSessionID
         self.requestTime = requestTime
         self.serveStartTime = serveStartTime
         self.serveEndTime = serveEndTime
@@ -276,16 +834,94 @@ class RoomRecord(db.Model):
         self.accumulatedConsumption = accumulatedConsumption
 
 
+class BillingEntry(db.Model):
+    __tablename__ = 'billing_entries'
+    # 账目：每段服务一条，只追加不修改；与 billing_totals、billing_rollups 在同一事务中写入
+    __table_args__ = (Index('ix_billing_entries_session', 'customerSessionID', 'createTime'),)
+    id = Column(Integer, primary_key=True)
+    customerSessionID = Column(String, nullable=False)
+    roomID = Column(Integer, nullable=False)
+    createTime = Column(DateTime, nullable=False)  # 服务结束时间
+    fanSpeed = Column(String)
+    rate = Column(Float)
+    energy = Column(Float)  # 温度改变量
+    amount = Column(Float)  # 费用
+
+
+class BillingTotal(db.Model):
+    __tablename__ = 'billing_totals'
+    # 每次入住的累计费用，写入账目时累加，结账时直接读取
+    customerSessionID = Column(String, primary_key=True)
+    roomID = Column(Integer, nullable=False)
+    energy = Column(Float, nullable=False)
+    amount = Column(Float, nullable=False)
+    entries = Column(Integer, nullable=False)
+    updateTime = Column(DateTime, nullable=False)
+
+    def __init__(self, customerSessionID: str, roomID: int, energy: float, amount: float, entries: int):
+        self.customerSessionID = customerSessionID
+        self.roomID = roomID
+        self.energy = energy
+        self.amount = amount
+        self.entries = entries
+        self.updateTime = datetime.now()
+
+
+class BillingRollup(db.Model):
+    __tablename__ = 'billing_rollups'
+    # 每个房间按小时、按天汇总的费用，营收报表只读这张表
+    granularity = Column(String, primary_key=True)  # hour / day
+    periodStart = Column(DateTime, primary_key=True)
+    roomID = Column(Integer, primary_key=True)
+    energy = Column(Float, nullable=False)
+    amount = Column(Float, nullable=False)
+    entries = Column(Integer, nullable=False)
+
+    def __init__(self, granularity: str, periodStart: datetime, roomID: int, energy: float, amount: float,
+                 entries: int):
+        self.granularity = granularity
+        self.periodStart = periodStart
+        self.roomID = roomID
+        self.energy = energy
+        self.amount = amount
+        self.entries = entries
+
+
+class UsageRollup(db.Model):
+    __tablename__ = 'usage_rollups'
+    # 每个房间每天每种风速的空调使用汇总，写入详单时累加，管理员报表只读这张表
+    day = Column(DateTime, primary_key=True)
+    roomID = Column(Integer, primary_key=True)
+    fanSpeed = Column(String, primary_key=True)
+    turnOns = Column(Integer, nullable=False)  # 开机次数
+    servedSeconds = Column(Float, nullable=False)  # 服务时长
+    dispatches = Column(Integer, nullable=False)  # 调度次数（服务段数）
+    energy = Column(Float, nullable=False)  # 温度改变量
+    fees = Column(Float, nullable=False)
+
+    def __init__(self, day: datetime, roomID: int, fanSpeed: str, turnOns: int, servedSeconds: float, dispatches: int,
+                 energy: float, fees: float):
+        self.day = day
+        self.roomID = roomID
+        self.fanSpeed = fanSpeed
+        self.turnOns = turnOns
+        self.servedSeconds = servedSeconds
+        self.dispatches = dispatches
+        self.energy = energy
+        self.fees = fees
+
+
 class Setting(db.Model):
     __tablename__ = 'settings'
     settingID = Column(Integer, primary_key=True)
-    createTime = Column(DateTime)
-    rate = Column(Float)
+    createTime = Column(DateTime, index=True)
+    rate = Column(Float)  # 统一费率，没有在 setting_rates 中单独设置的风速使用
     defaultFanSpeed = Column(Enum(FanSpeed))
     defaultTemperature = Column(Integer)
     minTemperature = Column(Integer)
     maxTemperature = Column(Integer)
     acMode = Column(Enum(AcMode))
+    speedRates = relationship('SettingRate')
 
     def __init__(self, rate: float, defaultFanSpeed: FanSpeed, defaultTemperature: int, minTemperature: int,
                  maxTemperature: int, acMode: AcMode):
@@ -299,45 +935,198 @@ class Setting(db.Model):
         self.createTime = datetime.now()
 
 
-with app.app_context():
-    db.create_all()
+class SettingRate(db.Model):
+    __tablename__ = 'setting_rates'
+    # 每种风速的费率，属于某一条设置
+    settingID = Column(Integer, ForeignKey('settings.settingID'), primary_key=True)
+    fanSpeed = Column(Enum(FanSpeed), primary_key=True)
+    rate = Column(Float, nullable=False)
 
-    # 检查并添加 Room
-    existing_room = Room.query.filter_by(roomName='211').first()
-    if not existing_room:
-        room = Room('211', '大床房', 300, 25, FanSpeed.MEDIUM, AcMode.HEAT)
-        db.session.add(room)
-        db.session.commit()
-    else:
-        # 如果房间已存在，根据需要决定是更新还是跳过
-        # 例如: room = existing_room
-        pass
+    def __init__(self, fanSpeed: FanSpeed, rate: float):
+        self.fanSpeed = fanSpeed
+        self.rate = rate
 
-    # 检查并添加 Account
-    existing_account = Account.query.filter_by(username='222').first()
-    if not existing_account:
-        account = Account('222', '222', Role.manager)
-        db.session.add(account)
-        db.session.commit()
-    else:
-        # 如果账户已存在，根据需要决定是更新还是跳过
-        # 例如: account = existing_account
-        pass
 
-    # 检查并添加第二个 Account
-    existing_account2 = Account.query.filter_by(username='111').first()
-    if not existing_account2:
-        account2 = Account('111', '111', Role.customer, room.roomID, '66666', '13w3252')
-        db.session.add(account2)
+class SettingSnapshot:
+    """
+    最新一条设置的只读副本，不与数据库会话绑定，可以在线程之间共享
+    rates 为每种风速的费率 {FanSpeed: 费率}
+    """
+    __slots__ = ('settingID', 'createTime', 'rate', 'defaultFanSpeed', 'defaultTemperature', 'minTemperature',
+                 'maxTemperature', 'acMode', 'rates')
+
+    def __init__(self, setting: Setting):
+        for name in self.__slots__[:-1]:
+            setattr(self, name, getattr(setting, name))
+        self.rates = speed_rates(setting.rate, {rate.fanSpeed: rate.rate for rate in setting.speedRates})
+
+
+class SettingsCache:
+    """
+    进程内缓存的当前设置
+    change_settings 写入新设置后失效；ttl 秒后也会重新读取，以便看到其他进程写入的设置
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.value = None
+        self.loaded_at = 0.
+        self.lock = threading.Lock()
+
+    def get(self):
+        value = self.value
+        if value is not None and time.time() - self.loaded_at < self.ttl:
+            return value
+        with self.lock:
+            if self.value is None or time.time() - self.loaded_at >= self.ttl:
+                setting = db.session.query(Setting).order_by(Setting.createTime.desc()).first()
+                self.value = SettingSnapshot(setting) if setting is not None else None
+                self.loaded_at = time.time()
+            return self.value
+
+    def invalidate(self):
+        with self.lock:
+            self.value = None
+
+
+settings_cache = SettingsCache()
+
+
+class Principal:
+    """
+    调用者身份的只读副本（不与数据库会话绑定），用于权限判断
+    """
+    __slots__ = ('accountID', 'username', 'role', 'roomID')
+
+    def __init__(self, account: Account):
+        for name in self.__slots__:
+            setattr(self, name, getattr(account, name))
+
+    @property
+    def room(self):
+        return db.session.get(Room, self.roomID) if self.roomID is not None else None
+
+
+# token -> Principal，按 ('id', accountID) 或 ('username', username) 缓存
+# 删除帐号、退房时失效；其他进程删除的帐号在 ttl 秒后失效
+principal_cache = TTLCache(maxsize=4096, ttl=30)
+
+
+def load_principal(**criteria):
+    account = db.session.query(Account).filter_by(**criteria).one_or_none()
+    return Principal(account) if account is not None else None
+
+
+def authenticate(accountID=None, username=None):
+    """
+    根据 token 解析调用者身份，找不到帐号时返回 401
+    token 是 accountID 或 username（网页端的 session 中保存的是 username）
+    """
+    if accountID is not None:
+        try:
+            accountID = int(accountID)
+        except (TypeError, ValueError):
+            abort(401, "Unauthorized")
+        principal = principal_cache.get_or_load(('id', accountID), lambda: load_principal(accountID=accountID))
     else:
-        # 如果账户已存在，根据需要决定是更新还是跳过
-        # 例如: account2 = existing_account2
-        pass
+        principal = principal_cache.get_or_load(('username', username), lambda: load_principal(username=username))
+    if principal is None:
+        abort(401, "Unauthorized")
+    return principal
+
+
+def forget_principals(accounts):
+    # 帐号被删除（包括退房时删除客户帐号）后清除缓存的身份和登录验证结果
+    principal_cache.invalidate(*[key for account in accounts
+                                 for key in (('id', account.accountID), ('username', account.username))])
+    login_cache.invalidate(*[(account.username, account.role) for account in accounts])
+
+
+# (username, role) -> (密码摘要, accountID)：短时间内重复登录时不再计算密码哈希
+# 摘要使用进程内随机密钥的 HMAC，缓存中不保存可以离线破解的密码哈希
+login_cache = TTLCache(maxsize=4096, ttl=300)
+LOGIN_CACHE_KEY = os.urandom(32)
+
+
+def password_digest(password):
+    return hmac.new(LOGIN_CACHE_KEY, password.encode('utf-8'), hashlib.sha256).digest()
+
+
+class SchedulerLease(db.Model):
+    __tablename__ = 'scheduler_lease'
+    # 主调度器的租约，只有一行；持有者在 expiresAt 之前续约
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)
+    expiresAt = Column(DateTime, nullable=False)
+
+    def __init__(self, name: str, holder: str, expiresAt: datetime):
+        self.name = name
+        self.holder = holder
+        self.expiresAt = expiresAt
+
+
+class SchedulerCommand(db.Model):
+    __tablename__ = 'scheduler_commands'
+    # 非主调度器进程转发给主调度器的命令，执行后删除
+    id = Column(Integer, primary_key=True)
+    roomID = Column(Integer, nullable=False)
+    command = Column(String, nullable=False)  # turn_on / turn_off / sync / reset / forget
+    createTime = Column(DateTime, nullable=False)
+
+    def __init__(self, roomID: int, command: str):
+        assert command == 'forget' or command in COMMANDS, f'unknown command {command}'
+        self.roomID = roomID
+        self.command = command
+        self.createTime = datetime.now()
+
+
+def init_db(app):
+    """
+    建表、补建索引并写入初始数据，只需在部署或启动调度器的进程中执行一次
+    """
+    with app.app_context():
+        db.create_all()
+        for table in (Setting.__table__, RoomRecord.__table__):  # 已有数据库中补建索引
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+
+        # 检查并添加 Room
+        existing_room = Room.query.filter_by(roomName='211').first()
+        if not existing_room:
+            room = Room('211', '大床房', 300, 25, FanSpeed.MEDIUM, AcMode.HEAT)
+            db.session.add(room)
+            db.session.commit()
+        else:
+            # 如果房间已存在，根据需要决定是更新还是跳过
+            room = existing_room
+
+        # 检查并添加 Account
+        existing_account = Account.query.filter_by(username='222').first()
+        if not existing_account:
+            account = Account('222', '222', Role.manager)
+            db.session.add(account)
+            db.session.commit()
+        else:
+            # 如果账户已存在，根据需要决定是更新还是跳过
+            # 例如: account = existing_account
+            pass
+
+        # 检查并添加第二个 Account
+        existing_account2 = Account.query.filter_by(username='111').first()
+        if not existing_account2:
+            account2 = Account('111', '111', Role.customer, room.roomID, '66666', '13w3252')
+            db.session.add(account2)
+        else:
+            # 如果账户已存在，根据需要决定是更新还是跳过
+            # 例如: account2 = existing_account2
+            pass
+
+        # 没有任何设置时添加默认 Setting
+        if db.session.query(Setting.settingID).first() is None:
+            settings = Setting(1., FanSpeed.MEDIUM, 25, 16, 30, AcMode.HEAT)
+            db.session.add(settings)
+        db.session.commit()
 
-    # 添加 Setting
-    settings = Setting(1., FanSpeed.MEDIUM, 25, 16, 30, AcMode.HEAT)
-    db.session.add(settings)
-    db.session.commit()
 
 def create_account(data, account_id):
     """
@@ -354,7 +1143,7 @@ def create_account(data, account_id):
         # roomName (前台必选，管理员可选)
     :return:
     """
-    origin_account = db.session.query(Account).filter_by(accountID=account_id).one()
+    origin_account = authenticate(accountID=account_id)
     if origin_account.role == Role.customer:
         abort(401, "Unauthorized")  # 客户无权限访问该api
 
@@ -372,28 +1161,26 @@ def create_account(data, account_id):
         room = db.session.query(Room).filter_by(roomName=data['roomName']).one_or_none()
         if room is None:
             abort(404, "room not found")
-        if len(room.accounts) == 0:
-            latest_settings = db.session.query(Setting).order_by(Setting.createTime.desc()).first()
-            room.queueState = QueueState.IDLE
-            room.fanSpeed = latest_settings.defaultFanSpeed
-            room.acMode = latest_settings.acMode
-            room.consumption = 0.0
-            room.acTemperature = latest_settings.defaultTemperature
-            room.customerSessionID = str(uuid.uuid4())
-            room.checkInTime = datetime.now()
-        else:
+        if len(room.accounts) != 0:
             abort(403, "room is occupied")
         room_id = room.roomID
     else:
+        room = None
         room_id = None
 
     try:
+        # 先计算密码哈希，再占用房间：占用房间后到提交前持有数据库写锁
         new_account = Account(data['username'], data['password'], role, room_id, data.get('idCard'),
                               data.get('phoneNumber'))
-        db.session.add(new_account)
-        db.session.commit()
     except KeyError as error:
         abort(400, f'Bad request: {error}')
+    if room is not None and not claim_rooms({room_id: str(uuid.uuid4())}, settings_cache.get(), datetime.now()):
+        db.session.rollback()
+        abort(403, "room is occupied")  # 其他请求同时为这个房间办理了入住
+    db.session.add(new_account)
+    db.session.commit()
+    if room is not None:
+        submit_command('reset', room.roomID)
 
     return True
 
@@ -496,7 +1283,7 @@ def account_delete(data, token):
         # username 帐号删除, 管理员，只能删非客户帐号
     :return:
     """
-    origin_role = db.session.query(Account).filter_by(accountID=token).one().role
+    origin_role = authenticate(accountID=token).role
     if origin_role == Role.customer:
         abort(401, "Unauthorized")  # 客户无权访问
 
@@ -508,9 +1295,13 @@ def account_delete(data, token):
         room.checkInTime = None
         room.queueState = QueueState.IDLE
         room.consumption = 0.0
-        for account in room.accounts:  # 删除所有关联帐号
-            db.session.delete(account)
+        # 删除所有关联帐号：一次查询要清除缓存的身份，一条语句删除，不逐个加载 room.accounts
+        accounts = db.session.query(Account.accountID, Account.username, Account.role).filter_by(
+            roomID=room.roomID).all()
+        db.session.query(Account).filter_by(roomID=room.roomID).delete(synchronize_session=False)
         db.session.commit()
+        forget_principals(accounts)
+        submit_command('reset', room.roomID)
 
     elif data.get('username'):  # 提供帐号，删除帐号，只有管理员能删除非客户帐号
         account = db.session.query(Account).filter_by(username=data['username']).one_or_none()
@@ -523,10 +1314,203 @@ def account_delete(data, token):
 
         db.session.delete(account)
         db.session.commit()
+        forget_principals([account])
 
     return True
 
 
+BATCH_LIMIT = 500  # 批量入住、退房每次最多的房间数
+
+GUEST_FIELDS = ('roomName', 'username', 'password', 'idCard', 'phoneNumber')
+
+
+def batch_principal(token):
+    # 批量入住、退房只有管理员和前台可以办理
+    principal = authenticate(accountID=token)
+    if principal.role == Role.customer:
+        abort(401, "Unauthorized")
+    return principal
+
+
+def check_in_many(guests, token):
+    """
+    [管理员，前台]
+    批量入住（团队、会议）：一次查询检查所有房间是否存在、是否已入住，一次查询检查帐号名是否已存在，
+    密码哈希按完整 cost 在线程池中并行计算，全部帐号和入住会话在一个事务中提交
+    # guests: [{roomName, username, password, idCard, phoneNumber}]
+    :return: 与 guests 一一对应的结果 [{roomName, username, ok, status, error | customerSessionID}]
+    """
+    batch_principal(token)
+    if not isinstance(guests, list) or not guests:
+        abort(400, "guests must be a non-empty list")
+    if len(guests) > BATCH_LIMIT:
+        abort(413, f"at most {BATCH_LIMIT} guests per batch")
+
+    results = [dict(roomName=guest.get('roomName') if isinstance(guest, dict) else None,
+                    username=guest.get('username') if isinstance(guest, dict) else None, ok=False)
+               for guest in guests]
+
+    def fail(result, status, error):
+        result.update(status=status, error=error)
+
+    roomNames = {guest['roomName'] for guest in guests if isinstance(guest, dict) and guest.get('roomName')}
+    usernames = {guest['username'] for guest in guests if isinstance(guest, dict) and guest.get('username')}
+    # 房间及其帐号数（是否已入住）
+    rooms = {room.roomName: (room, occupants) for room, occupants in
+             db.session.query(Room, func.count(Account.accountID)).outerjoin(Account, Account.roomID == Room.roomID)
+             .filter(Room.roomName.in_(roomNames)).group_by(Room.roomID)}
+    taken = {username for username, in db.session.query(Account.username).filter(Account.username.in_(usernames))}
+
+    accepted = []
+    seen_rooms, seen_usernames = set(), set()
+    for guest, result in zip(guests, results):
+        if not isinstance(guest, dict) or any(not guest.get(name) for name in GUEST_FIELDS):
+            fail(result, 400, f"{', '.join(GUEST_FIELDS)} required")
+        elif guest['roomName'] not in rooms:
+            fail(result, 404, "room not found")
+        elif rooms[guest['roomName']][1] > 0 or guest['roomName'] in seen_rooms:
+            fail(result, 403, "room is occupied")
+        elif guest['username'] in taken or guest['username'] in seen_usernames:
+            fail(result, 409, "username already exists")
+        else:
+            seen_rooms.add(guest['roomName'])
+            seen_usernames.add(guest['username'])
+            accepted.append((guest, result))
+    if not accepted:
+        return results
+
+    # 先计算密码哈希，再占用房间：占用房间后到提交前持有数据库写锁
+    hashes = password_hasher.hash_many([str(guest['password']) for guest, _ in accepted])
+    now = datetime.now()
+    sessions = {rooms[guest['roomName']][0].roomID: str(uuid.uuid4()) for guest, _ in accepted}
+    claimed = claim_rooms(sessions, settings_cache.get(), now)
+    accounts, roomIDs = [], []
+    for (guest, result), passwordHash in zip(accepted, hashes):
+        roomID = rooms[guest['roomName']][0].roomID
+        if roomID not in claimed:  # 其他请求同时为这个房间办理了入住
+            fail(result, 403, "room is occupied")
+            continue
+        # 帐号以一次 executemany 插入，字段与 Account.__init__ 相同
+        accounts.append(dict(username=guest['username'], password=passwordHash, role=Role.customer,
+                             roomID=roomID, idCard=guest['idCard'], phoneNumber=guest['phoneNumber'],
+                             createTime=now))
+        roomIDs.append(roomID)
+        result.update(ok=True, status=201, customerSessionID=sessions[roomID])
+    if not accounts:
+        db.session.rollback()
+        return results
+    try:
+        db.session.execute(Account.__table__.insert(), accounts)
+        db.session.commit()
+    except IntegrityError:  # 其他请求同时使用了相同的帐号名
+        db.session.rollback()
+        for _, result in accepted:
+            if result['ok']:
+                result.pop('customerSessionID')
+                result.update(ok=False, status=409, error="username taken by a concurrent check-in, please retry")
+        return results
+    scheduler.submit_many([('reset', roomID) for roomID in roomIDs])
+    return results
+
+
+def claim_rooms(sessions, settings, now):
+    """
+    入住时占用房间：一条 UPDATE 只修改还没有入住会话的行，并发的单个、批量入住不会占用同一个房间
+    :param sessions: {roomID: 新的 customerSessionID}
+    :return: 本次成功占用的 roomID
+    """
+    claimed = db.session.query(Room).filter(Room.roomID.in_(sessions), Room.customerSessionID.is_(None)).update(
+        {Room.customerSessionID: case(sessions, value=Room.roomID), Room.queueState: QueueState.IDLE,
+         Room.fanSpeed: settings.defaultFanSpeed, Room.acMode: settings.acMode, Room.consumption: 0.0,
+         Room.acTemperature: settings.defaultTemperature, Room.checkInTime: now}, synchronize_session=False)
+    if claimed == len(sessions):
+        return set(sessions)
+    # 部分房间已被其他请求占用：按本次写入的会话ID找出占用成功的房间
+    return {roomID for roomID, in
+            db.session.query(Room.roomID).filter(Room.customerSessionID.in_(list(sessions.values())))}
+
+
+def check_out_many(roomNames, token):
+    """
+    [管理员，前台]
+    批量退房：一次查询房间，一次查询账单总额，一次查询并删除全部关联帐号，在一个事务中提交
+    :return: 与 roomNames 一一对应的结果 [{roomName, ok, status, error | bill}]
+    """
+    batch_principal(token)
+    if not isinstance(roomNames, list) or not roomNames:
+        abort(400, "roomNames must be a non-empty list")
+    if len(roomNames) > BATCH_LIMIT:
+        abort(413, f"at most {BATCH_LIMIT} rooms per batch")
+
+    rooms = {room.roomName: room for room in
+             db.session.query(Room).filter(Room.roomName.in_([name for name in roomNames if isinstance(name, str)]))}
+    results, checked_out = [], {}
+    for roomName in roomNames:
+        room = rooms.get(roomName)
+        if room is None:
+            results.append(dict(roomName=roomName, ok=False, status=404, error="room not found"))
+        elif roomName in checked_out:
+            results.append(dict(roomName=roomName, ok=False, status=400, error="duplicate roomName"))
+        else:
+            checked_out[roomName] = room
+            results.append(dict(roomName=roomName, ok=True, status=200))
+    if not checked_out:
+        return results
+
+    # 账单在重置房间之前计算（调度器中的实时费用在执行 reset 命令后才清零）
+    totals = storage.billing_totals([room.customerSessionID for room in checked_out.values()
+                                     if room.customerSessionID is not None])
+    bills = {roomName: room_bill(room, totals=totals) for roomName, room in checked_out.items()}
+    roomIDs = [room.roomID for room in checked_out.values()]
+    accounts = db.session.query(Account.accountID, Account.username, Account.role).filter(
+        Account.roomID.in_(roomIDs)).all()  # 提交后用于清除缓存的身份
+    db.session.query(Account).filter(Account.roomID.in_(roomIDs)).delete(synchronize_session=False)
+    for room in checked_out.values():
+        room.customerSessionID = None
+        room.checkInTime = None
+        room.queueState = QueueState.IDLE
+        room.consumption = 0.0
+    db.session.commit()
+    forget_principals(accounts)
+    scheduler.submit_many([('reset', roomID) for roomID in roomIDs])
+    for result in results:
+        if result['ok']:
+            result['bill'] = bills[result['roomName']]
+    return results
+
+
+@api.route('/check-in/batch', methods=['POST'])
+@query_budget(10)
+def check_in_batch():
+    """
+    [管理员，前台]
+    批量入住，部分房间失败不影响其他房间
+    # data
+        # token
+        # guests  [{roomName, username, password, idCard, phoneNumber}]
+    """
+    data = request.get_json(silent=True) or {}
+    results = check_in_many(data.get('guests'), data.get('token') or request_token())
+    succeeded = sum(result['ok'] for result in results)
+    return jsonify(results=results, succeeded=succeeded, failed=len(results) - succeeded), 200
+
+
+@api.route('/check-out/batch', methods=['POST'])
+@query_budget(8)
+def check_out_batch():
+    """
+    [管理员，前台]
+    批量退房，返回每个房间本次入住的账单
+    # data
+        # token
+        # roomNames  [roomName]
+    """
+    data = request.get_json(silent=True) or {}
+    results = check_out_many(data.get('roomNames'), data.get('token') or request_token())
+    succeeded = sum(result['ok'] for result in results)
+    return jsonify(results=results, succeeded=succeeded, failed=len(results) - succeeded), 200
+
+
 def login(data):
     """
     parameters:
@@ -544,15 +1528,71 @@ def login(data):
         role = Role[data['role']]
     except KeyError:
         return False
-    result = db.session.query(Account).filter_by(username=data['username'], password=data['password'],
-                                                 role=role).one_or_none()
-    print(data)
+    username, password = data['username'], str(data['password'])
+    digest = password_digest(password)
+    cached = login_cache.get((username, role))
+    if cached is not None and hmac.compare_digest(cached[0], digest):
+        return {'token': cached[1]}
+
+    result = db.session.query(Account).filter_by(username=username, role=role).one_or_none()
     if result is None:
         return False
+    if not password_hasher.verify(password, result.password):  # 计算时释放 GIL，不需要转交线程池
+        return False
+    if password_hasher.needs_rehash(result.password):  # 明文密码或 cost 已调整，登录成功时重新计算
+        result.password = password_hasher.hash(password)
+        db.session.commit()
+    login_cache.set((username, role), (digest, result.accountID))
     return {'token': result.accountID}
 
 
-@app.route('/room/create', methods=['POST'])
+@api.route('/scheduler/stats', methods=['GET'])
+@query_budget(0)
+def scheduler_stats():
+    """
+    调度器运行指标：调度次数、耗时、延迟、落后次数、队列长度
+    """
+    return jsonify(scheduler.stats())
+
+
+@api.route('/metrics', methods=['GET'])
+@query_budget(0)
+def metrics_endpoint():
+    """
+    Prometheus 文本格式的指标：请求耗时、每个请求的 SQL 语句数、调度各阶段耗时、队列长度
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@api.route('/debug/profiler', methods=['GET', 'POST'])
+def profiler_endpoint():
+    """
+    [管理员]
+    采样分析器，需要 PROFILER_ENABLED
+        POST {"action": "start"} / {"action": "stop"}
+        GET 返回折叠格式的调用栈（flamegraph.pl / speedscope 可读），?stats=1 只返回采样统计
+    """
+    if not current_app.config['PROFILER_ENABLED']:
+        abort(404)
+    token = request_token()
+    if token is None or authenticate(accountID=token).role != Role.manager:
+        abort(401, "Unauthorized")
+    if request.method == 'POST':
+        action = (request.get_json(silent=True) or {}).get('action')
+        if action == 'start':
+            profiler.start()
+        elif action == 'stop':
+            profiler.stop()
+        else:
+            abort(400)
+        return jsonify(profiler.stats())
+    if request.args.get('stats'):
+        return jsonify(profiler.stats())
+    return Response(profiler.folded(), mimetype='text/plain')
+
+
+@api.route('/room/create', methods=['POST'])
+@query_budget(6)
 def room_create():
     """
     [管理员]
@@ -565,13 +1605,12 @@ def room_create():
 
     :return:
     """
-    print(request.json['token'])
-    origin_role = db.session.query(Account).filter_by(username=request.json['token']).one().role
+    origin_role = authenticate(username=request.json['token']).role
     if origin_role != Role.manager:
         abort(401, "Unauthorized")
 
     data = request.json
-    latest_settings = db.session.query(Setting).order_by(Setting.createTime.desc()).first()
+    latest_settings = settings_cache.get()
     new_room = Room(roomName=data['roomName'],
                     roomDescription=data['roomDescription'],
                     unitPrice=data['unitPrice'],
@@ -580,44 +1619,336 @@ def room_create():
                     acMode=latest_settings.acMode)
     db.session.add(new_room)
     db.session.commit()
+    submit_command('sync', new_room.roomID)
 
     return jsonify({"msg": "创建成功"}), 201
 
 
-def room_info(room: Room, require_details=False, for_manager=True):
+def room_info(room: Room, require_details=False, for_manager=True, source=None):
+    """
+    :param source: 提供实时状态和存储的调度器，默认为全局调度器（仿真时传入使用内存存储的调度器）
+    """
     if room is None:
         abort(404, "room not found")
-    if require_details and room.records is None:
-        abort(404, "record not found")
-    latest_settings = db.session.query(Setting).order_by(Setting.createTime.desc()).first()
+    source = source or scheduler
+    latest_settings = source.storage.latest_settings()
     if require_details:
         if not for_manager:
-            records = db.session.query(RoomRecord).filter_by(customSessionID=room.customerSessionID).all()
+            records, cursor = query_records(sessionID=room.customerSessionID, store=source.storage)
         else:
-            records = db.session.query(RoomRecord).filter_by(roomID=room.roomID).all()
+            records, cursor = query_records(roomID=room.roomID, store=source.storage)
     else:
-        records = None
-    timeLeft = (datetime.now() - room.firstRuntime) / timedelta(
-        minutes=2) * scheduler.boost if room.firstRuntime is not None else None
+        records, cursor = None, None
+    info = room_status(room, latest_settings, source.clock.now(), source)
+    info['roomDetails'] = [record_info(record) for record in records] if records is not None else None
+    info['detailsCursor'] = cursor
+    return info
+
+
+def room_status(room, latest_settings, now, source=None):
+    """
+    房间的状态信息（不含详单），room 可以是 Room 对象，也可以是只查询了所需列的行
+    """
+    source = source or scheduler
+    live = source.live(room)  # 温度、队列状态、费用以调度器内存中的为准
+    timeLeft = source.time_left(live.firstRuntime, now)
     return dict(roomID=room.roomID, roomName=room.roomName, roomDescription=room.roomDescription,
-                roomTemperature=room.roomTemperature, timeLeft=timeLeft, unitPrice=room.unitPrice,
+                roomTemperature=live.roomTemperature, timeLeft=timeLeft, unitPrice=room.unitPrice,
                 acTemperature=max(min(room.acTemperature, latest_settings.maxTemperature),
                                   latest_settings.minTemperature),
                 fanSpeed=room.fanSpeed.value, acMode=latest_settings.acMode.value,
-                initialTemperature=room.initialTemperature, queueState=room.queueState.value,
+                initialTemperature=room.initialTemperature, queueState=live.queueState.value,
                 minTemperature=latest_settings.minTemperature, maxTemperature=latest_settings.maxTemperature,
-                firstRunTime=room.firstRuntime, customerSessionID=room.customerSessionID, consumption=room.consumption,
-                checkInTime=room.checkInTime, occupied=room.customerSessionID is not None,
-                roomDetails=[record_info(record) for record in records] if records is not None else None)
+                firstRunTime=live.firstRuntime, customerSessionID=room.customerSessionID, consumption=live.consumption,
+                checkInTime=room.checkInTime, occupied=room.customerSessionID is not None, roomDetails=None)
+
+
+# 房间状态列表只需要的列，避免加载整行和关联关系
+ROOM_STATUS_COLUMNS = (Room.roomID, Room.roomName, Room.roomDescription, Room.unitPrice, Room.roomTemperature,
+                       Room.acTemperature, Room.fanSpeed, Room.initialTemperature, Room.queueState, Room.firstRuntime,
+                       Room.customerSessionID, Room.consumption, Room.checkInTime)
+
+
+def rooms_snapshot():
+    """
+    所有房间的状态，一次查询完成
+    """
+    latest_settings = settings_cache.get()
+    now = datetime.now()
+    rows = db.session.query(*ROOM_STATUS_COLUMNS).order_by(Room.roomID).all()
+    return [room_status(row, latest_settings, now) for row in rows]
 
 
 def record_info(record: RoomRecord):
-    return dict(id=record.id, duration=record.serveEndTime - record.serveStartTime,
+    return dict(id=record.id, duration=(record.serveEndTime - record.serveStartTime).total_seconds(),
                 requestTime=record.requestTime, serveStartTime=record.serveStartTime, serveEndTime=record.serveEndTime,
-                fanSpeed=record.fanSpeed.value, acMode=record.acMode.value, rate=record.rate,
+                fanSpeed=record.fanSpeed, acMode=record.acMode, rate=record.rate,
                 consumption=record.consumption, accumulatedConsumption=record.accumulatedConsumption)
 
 
+def encode_cursor(record: RoomRecord):
+    return f'{record.serveStartTime.isoformat()},{record.id}'
+
+
+def decode_cursor(cursor):
+    try:
+        serveStartTime, record_id = cursor.rsplit(',', 1)
+        return datetime.fromisoformat(serveStartTime), int(record_id)
+    except ValueError:
+        abort(400, "invalid cursor")
+
+
+def query_records(roomID=None, sessionID=None, start=None, end=None, cursor=None, limit=100, store=None):
+    """
+    按房间或入住会话查询详单，可限定服务开始时间范围 [start, end)
+    按 (serveStartTime, id) 做游标分页，每页都走索引，不随历史记录增长变慢
+    :param cursor: 上一页返回的游标
+    :param store: 详单所在的存储，默认为全局调度器的存储
+    :return: (本页记录, 下一页游标；没有下一页时为 None)
+    """
+    store = store or scheduler.storage
+    after = decode_cursor(cursor) if cursor is not None else None
+    records = store.query_records(roomID=roomID, sessionID=sessionID, start=start, end=end, after=after,
+                                  limit=limit + 1)
+    if len(records) > limit:
+        return records[:limit], encode_cursor(records[limit - 1])
+    return records, None
+
+
+def prune_records(retention=timedelta(days=3 * 365), chunk_size=1000, archive=None):
+    """
+    删除服务开始时间早于保留期的详单，每批 chunk_size 条一个事务，避免长时间占用写锁
+    :param archive: 可选，删除前以每批记录调用，用于归档
+    :return: 删除的条数
+    """
+    cutoff = datetime.now() - retention
+    deleted = 0
+    while True:
+        query = db.session.query(RoomRecord).filter(RoomRecord.serveStartTime < cutoff)
+        records = query.order_by(RoomRecord.serveStartTime).limit(chunk_size).all()
+        if not records:
+            return deleted
+        if archive is not None:
+            archive(records)
+        ids = [record.id for record in records]
+        db.session.query(RoomRecord).filter(RoomRecord.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+        if len(ids) < chunk_size:
+            return deleted
+
+
+RECEIPT_HEADER = ('详单号', '请求时间', '开始服务时间', '结束服务时间', '服务时长(秒)', '风速', '模式', '费率', '本次费用',
+                  '累计费用')
+
+
+def receipt_rows(sessionID, batch_size=500, store=None):
+    """
+    逐行生成一次入住的详单 CSV，按批从数据库游标读取，内存占用与记录条数无关
+    """
+    store = store or scheduler.storage
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    buffer.write('\ufeff')  # BOM，Excel 打开时正确识别 UTF-8
+    writer.writerow(RECEIPT_HEADER)
+    yield flush()
+    for record in store.session_records(sessionID, batch_size):
+        writer.writerow((record.id, record.requestTime, record.serveStartTime, record.serveEndTime,
+                         (record.serveEndTime - record.serveStartTime).total_seconds(), record.fanSpeed,
+                         record.acMode, record.rate, record.consumption, record.accumulatedConsumption))
+        yield flush()
+
+
+@api.cli.command('prune-records')
+@click.option('--days', default=3 * 365, help='保留最近多少天的详单')
+@click.option('--chunk-size', default=1000, help='每个事务删除的条数')
+def prune_records_command(days, chunk_size):
+    """
+    清理超过保留期的详单（可由 cron 每天执行：flask --app end prune-records）
+    """
+    deleted = prune_records(timedelta(days=days), chunk_size)
+    click.echo(f'deleted {deleted} records older than {days} days')
+
+
+def parse_time(value):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, f"invalid time {value}")
+
+
+@api.route('/room-details', methods=['GET'])
+@api.route('/room-details/<string:roomName>', methods=['GET'])
+@query_budget(5)
+def room_details(roomName=None):
+    """
+    [客户，管理员]
+    分页查询详单，客户只能查看自己本次入住的，管理员可以查看任意房间的全部记录
+    # args
+        # start, end  服务开始时间范围（ISO 格式）
+        # cursor      上一页返回的 nextCursor
+        # limit       每页条数，最大 1000
+    """
+    token = request_token()
+    if token is None:
+        abort(401, "Unauthorized")
+    account_request = authenticate(accountID=token)
+    role_request = account_request.role
+    if role_request == Role.customer:
+        if roomName is not None:
+            abort(404, "only manager can visit other rooms")
+        room = account_request.room
+    elif role_request == Role.manager:
+        if roomName is None:
+            abort(404, f"{role_request.value} need param roomName")
+        room = db.session.query(Room).filter_by(roomName=roomName).one_or_none()
+    else:
+        abort(401, "Unauthorized")
+    if room is None:
+        abort(404, f"room {roomName} not found")
+
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    start, end = parse_time(request.args.get('start')), parse_time(request.args.get('end'))
+    if role_request == Role.customer:
+        records, cursor = query_records(sessionID=room.customerSessionID, start=start, end=end,
+                                        cursor=request.args.get('cursor'), limit=limit)
+    else:
+        records, cursor = query_records(roomID=room.roomID, start=start, end=end,
+                                        cursor=request.args.get('cursor'), limit=limit)
+    return jsonify(roomDetails=[record_info(record) for record in records], nextCursor=cursor), 200
+
+
+def room_bill(room, source=None, totals=None):
+    """
+    本次入住的费用：已入账的部分读 billing_totals 中的一行，正在服务、尚未入账的部分取自调度器的实时状态
+    （房间的 consumption 在入住时清零，就是本次入住的全部费用）
+    :param totals: 批量查询好的 {customerSessionID: 总额行}，不传时查询这一个会话
+    """
+    source = source or scheduler
+    sessionID = room.customerSessionID
+    if sessionID is None:
+        return None
+    total = totals.get(sessionID) if totals is not None else source.storage.billing_total(sessionID)
+    settled = total.amount if total is not None else 0.
+    live = source.live(room).consumption or 0.
+    return dict(customerSessionID=sessionID, roomID=room.roomID, roomName=room.roomName,
+                checkInTime=room.checkInTime, settled=settled, pending=max(live - settled, 0.),
+                total=max(live, settled), energy=total.energy if total is not None else 0.,
+                entries=total.entries if total is not None else 0,
+                rates={speed.value: rate for speed, rate in source.rates.items()})
+
+
+def room_expense(token, roomName=None):
+    """
+    [客户，前台，管理员]
+    客户只能查看自己房间本次入住的费用，前台和管理员按房间名查看
+    """
+    account_request = authenticate(accountID=token)
+    if account_request.role == Role.customer:
+        if roomName is not None and (account_request.room is None or account_request.room.roomName != roomName):
+            abort(404, "only manager and front desk can visit other rooms")
+        room = account_request.room
+    else:
+        if roomName is None:
+            abort(404, f"{account_request.role.value} need param roomName")
+        room = db.session.query(Room).filter_by(roomName=roomName).one_or_none()
+    if room is None:
+        abort(404, f"room {roomName} not found")
+    bill = room_bill(room)
+    if bill is None:
+        abort(404, "room is not in use")
+    return bill
+
+
+@api.route('/bill', methods=['GET'])
+@api.route('/bill/<string:roomName>', methods=['GET'])
+@query_budget(6)
+def bill(roomName=None):
+    """
+    [客户，前台，管理员]
+    本次入住的空调费用：已入账、尚未入账和合计
+    """
+    token = request_token()
+    if token is None:
+        abort(401, "Unauthorized")
+    return jsonify(room_expense(token, roomName)), 200
+
+
+@api.route('/revenue', methods=['GET'])
+@query_budget(4)
+def revenue():
+    """
+    [管理员]
+    按小时或按天汇总的空调费用，直接读取汇总表
+    # args
+        # granularity  hour / day（默认）
+        # start, end   汇总区间起点的范围（ISO 格式）
+        # roomName     只看一个房间
+    """
+    token = request_token()
+    if token is None or authenticate(accountID=token).role != Role.manager:
+        abort(401, "Unauthorized")
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        abort(400, f"granularity must be one of {', '.join(GRANULARITIES)}")
+    roomID = None
+    if request.args.get('roomName'):
+        room = db.session.query(Room).filter_by(roomName=request.args['roomName']).one_or_none()
+        if room is None:
+            abort(404, f"room {request.args['roomName']} not found")
+        roomID = room.roomID
+    rollups = storage.revenue(granularity, parse_time(request.args.get('start')), parse_time(request.args.get('end')),
+                              roomID)
+    return jsonify(granularity=granularity,
+                   revenue=[dict(periodStart=rollup.periodStart, roomID=rollup.roomID, energy=rollup.energy,
+                                 amount=rollup.amount, entries=rollup.entries) for rollup in rollups],
+                   total=sum(rollup.amount for rollup in rollups)), 200
+
+
+@api.route('/report', methods=['GET'])
+@query_budget(5)
+def report():
+    """
+    [管理员]
+    空调使用报表：开机次数、服务时长、调度次数、能耗、费用，按房间、风速、天分组
+    只读取周期内的每日汇总行，与详单的总量无关
+    # args
+        # period    daily（默认）/ weekly / monthly
+        # date      周期内的任意一天（ISO 格式），默认今天
+        # roomName  只看一个房间
+    """
+    token = request_token()
+    if token is None or authenticate(accountID=token).role != Role.manager:
+        abort(401, "Unauthorized")
+    period = request.args.get('period', 'daily')
+    if period not in PERIODS:
+        abort(400, f"period must be one of {', '.join(PERIODS)}")
+    day = (parse_time(request.args.get('date')) or datetime.now()).date()
+    start, end = period_range(period, day)
+    roomID = None
+    if request.args.get('roomName'):
+        room = db.session.query(Room).filter_by(roomName=request.args['roomName']).one_or_none()
+        if room is None:
+            abort(404, f"room {request.args['roomName']} not found")
+        roomID = room.roomID
+    usage = summarize_usage(storage.usage(datetime.combine(start, datetime.min.time()),
+                                          datetime.combine(end, datetime.min.time()), roomID))
+    names = dict(db.session.query(Room.roomID, Room.roomName).filter(
+        Room.roomID.in_([room['roomID'] for room in usage['rooms']])))
+    for room in usage['rooms']:
+        room['roomName'] = names.get(room['roomID'])
+    return jsonify(period=period, start=start.isoformat(), end=end.isoformat(), **usage), 200
+
+
 def room_get(token, roomName=None):
     """
     [客户，前台，管理员]
@@ -641,13 +1972,13 @@ def room_get(token, roomName=None):
     :param roomName: 房间号 (不填则根据客户信息自动导航)
     :return:
     """
-    account_request = db.session.query(Account).filter_by(accountID=token).one()
-    room, role_request = account_request.room, account_request.role
+    account_request = authenticate(accountID=token)
+    role_request = account_request.role
     if role_request != Role.manager and roomName is not None:
         abort(404, "only manager can visit other rooms")
     if role_request != Role.customer and roomName is None:
         abort(404, f"{role_request.value} need param roomName")
-    room = room if role_request == Role.customer else db.session.query(Room).filter_by(roomName=roomName).one_or_none()
+    room = account_request.room if role_request == Role.customer else db.session.query(Room).filter_by(roomName=roomName).one_or_none()
     if room is None:
         abort(404, f"room {roomName} not found")
 
@@ -679,31 +2010,30 @@ def room_post(data, token, roomName=None):
     :param roomName: 房间号 (不填则根据客户信息自动导航)
     :return:
     """
-    account_request = db.session.query(Account).filter_by(accountID=token).one()
-    room, role_request = account_request.room, account_request.role
+    account_request = authenticate(accountID=token)
+    role_request = account_request.role
     if role_request != Role.manager and roomName is not None:
         abort(404, "only manager can visit other rooms")
     if role_request != Role.customer and roomName is None:
         abort(404, f"{role_request.value} need param roomName")
-    room = room if role_request == Role.customer else db.session.query(Room).filter_by(roomName=roomName).one_or_none()
+    room = account_request.room if role_request == Role.customer else db.session.query(Room).filter_by(roomName=roomName).one_or_none()
     if room is None:
         abort(404, f"room {roomName} not found")
     if role_request == Role.frontDesk:
         abort(403, "front-desk should not edit room states")
-    latest_settings = db.session.query(Setting).order_by(Setting.createTime.desc()).first()
+    latest_settings = settings_cache.get()
     if isinstance(data, dict) and len({'acTemperature', 'fanSpeed', 'state'} - set(data.keys())) > 0:  # 检测到空调状态修改请求
         if data.get('acTemperature') and latest_settings.minTemperature < int(
                 data['acTemperature']) < latest_settings.maxTemperature:
             room.acTemperature = int(data['acTemperature'])
-            print(room.acTemperature)
+            logger.debug('room %s target temperature %s', room.roomID, room.acTemperature)
         if data.get('fanSpeed'):
             if data['fanSpeed'] in FanSpeed.__dict__.keys():
                 room.fanSpeed = FanSpeed[data['fanSpeed']]
-        # 检测到空调开关机请求
-        if data['acState']:
-            scheduler.turn_on(room)
-        else:
-            scheduler.turn_off(room)
+        # 检测到空调开关机请求，在修改提交后交给调度器
+        command = 'turn_on' if data['acState'] else 'turn_off'
+    else:
+        command = None
     if role_request != Role.manager and (data.get('roomName') or data.get('roomDescription')):
         abort(401, "Unauthorized")
     if data.get('roomName'):  # 酒店管理员可以修改房间名和房间描述，房间的单价只有在房间创建时才能指定，不能修改
@@ -711,6 +2041,8 @@ def room_post(data, token, roomName=None):
     if data.get('roomDescription'):
         room.roomDescription = data['roomDescription']
     db.session.commit()
+    if command is not None:
+        submit_command(command, room.roomID)
     return True
 
 
@@ -720,15 +2052,37 @@ def get_rooms(token):
     查看所有房间状态
     :return:
     """
-    role_request = db.session.query(Account).filter_by(accountID=token).one().role
+    role_request = authenticate(accountID=token).role
     if role_request == Role.customer:
         abort(401, "Unauthorized")
-    rooms = db.session.query(Room).all()
-    rooms_info = [room_info(room) for room in rooms]
-    return rooms_info
+    return rooms_snapshot()
+
+
+def request_token():
+    # 请求头 Authorization: Bearer <token> 优先，其次是网页登录后 session 中的 token
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        return authorization[len('Bearer '):]
+    return session.get('token')
+
+
+@api.route('/rooms', methods=['GET'])
+@query_budget(4)
+def rooms_status():
+    """
+    [管理员，前台]
+    所有房间状态的 JSON，支持 ETag / If-None-Match，内容未变化时返回 304
+    """
+    token = request_token()
+    if token is None:
+        abort(401, "Unauthorized")
+    response = jsonify(rooms=get_rooms(token))
+    response.add_etag()
+    return response.make_conditional(request)
 
 
-@app.route('/room/delete', methods=['POST'])
+@api.route('/room/delete', methods=['POST'])
+@query_budget(6)
 def delete_room():
     """
     [管理员]
@@ -737,7 +2091,7 @@ def delete_room():
         # roomName
     :return:
     """
-    role_request = db.session.query(Account).filter_by(accountID=request.json['token']).one().role
+    role_request = authenticate(accountID=request.json['token']).role
     if role_request != Role.manager:
         abort(401, "Unauthorized")
 
@@ -745,11 +2099,16 @@ def delete_room():
     if room_to_delete is None:
         abort(404, "room not exists")
 
-    if len(room_to_delete.accounts) > 0:
+    if db.session.query(Account.accountID).filter_by(roomID=room_to_delete.roomID).first() is not None:
         abort(401, "room occupied, please check-out first")
 
+    room_id = room_to_delete.roomID
+    # 详单保留，房间ID置空：一条 UPDATE，不加载房间的全部详单
+    db.session.query(RoomRecord).filter_by(roomID=room_id).update({RoomRecord.roomID: None},
+                                                                    synchronize_session=False)
     db.session.delete(room_to_delete)
     db.session.commit()
+    submit_command('forget', room_id)
     return jsonify({"msg": "注销成功"}), 201
 
 
@@ -765,38 +2124,51 @@ def change_settings(data):
         # acMode
         # defaultFanSpeed
         # rate
+        # rates  可选，各风速的费率 {"LOW": 0.8, "MEDIUM": 1, "HIGH": 1.5}，没有给出的风速使用 rate
     :return:
     """
-    account_request = db.session.query(Account).filter_by(username=data['token']).one()
+    account_request = authenticate(username=data['token'])
     if account_request.role != Role.manager:
         abort(401, "Unauthorized")
 
     setting = Setting(rate=data['rate'], defaultFanSpeed=FanSpeed[data['defaultFanSpeed']],
                         defaultTemperature=data['defaultTemperature'], acMode=data['acMode'],
                         minTemperature=data['minTemperature'], maxTemperature=data['maxTemperature'])
+    try:
+        setting.speedRates = [SettingRate(FanSpeed[speed], float(rate))
+                              for speed, rate in (data.get('rates') or {}).items() if rate not in (None, '')]
+    except (KeyError, ValueError):
+        abort(400, "invalid rates")
     db.session.add(setting)
     db.session.commit()
-   
+    settings_cache.invalidate()
+
     return True
 
 def get_settings(name):
-    account_request = db.session.query(Account).filter_by(username=name).one()
+    account_request = authenticate(username=name)
     if account_request.role != Role.manager:
         abort(401, "Unauthorized")
 
 
-    setting = db.session.query(Setting).order_by(Setting.createTime.desc()).first()
+    setting = settings_cache.get()
 
     return {'settingID':setting.settingID, 'lastEditTime':setting.createTime, 'rate':setting.rate,
                    'defaultFanSpeed':setting.defaultFanSpeed.value,
                    'defaultTemperature':setting.defaultTemperature, 'minTemperature':setting.minTemperature,
                    'maxTemperature':setting.maxTemperature,
-                   'acMode':setting.acMode.value}
+                   'acMode':setting.acMode.value,
+                   'rates':{speed.value: rate for speed, rate in setting.rates.items()}}
 
 
 
 PATH = '127.0.0.1:5000'  # '139.59.115.34:5000'
 
+# 远程日志服务，地址由配置 LOG_SERVICE_URL 决定（本地替身见 utils/log_stub.py）
+log_client = LogClient('http://se.dahuangggg.me')
+metrics.gauge('hotel_log_service_circuit_open', '日志服务熔断器是否打开',
+              callback=lambda: int(log_client.breaker.state != log_client.breaker.CLOSED))
+
 
 def translate(x):
     trans_dict = {
@@ -843,7 +2215,7 @@ class log_data():
         for dict in lst:
             if dict['customerSessionID'] == data['username']:
                 room_id = dict['roomName']
-        print(token, room_id)
+        logger.debug('login %s: room %s', token, room_id)
         return token, room_id
 
 
@@ -881,10 +2253,10 @@ class hotel_data():
                     input_data['acState'] = not input_data['acState']
             else:
                 input_data[key] = value
-        print(input_data)
+        logger.debug('update ac of room %s: %s', room_id, input_data)
         response = room_post(data=input_data, token=headers)
         if response:
-            print('更新成功')
+            logger.debug('更新成功')
         return data['roomTemperature']
 
     def room(self, token):
@@ -901,7 +2273,7 @@ class hotel_data():
         """
         入住
         """
-        print('check_in')
+        logger.debug('check in room %s', roomNumber)
 
         data = {
             'username': user_name,
@@ -911,10 +2283,9 @@ class hotel_data():
             'roomName': roomNumber,
             'role': 'customer'
         }
-        print(data)
         response = create_account(data, token)
         if response:
-            print('success')
+            logger.info('checked in %s to room %s', user_name, roomNumber)
             return True
 
     def check_out(self, room_id, token):
@@ -924,43 +2295,46 @@ class hotel_data():
         data = {
             'roomName': int(room_id)
         }
-        print(data)
+        session_id = self.customer_session(room_id)  # 退房前记下本次入住的会话，用于导出详单
         response = account_delete(data, token)
         if response:
-            return True, self.check_room_expense(int(room_id), token)
+            return True, session_id
         else:
             return False, None
 
+    def customer_session(self, room_id):
+        """
+        房间当前入住的会话ID，无人入住时为 None
+        """
+        room = db.session.query(Room).filter_by(roomName=str(room_id)).one_or_none()
+        return None if room is None else room.customerSessionID
+
     def check(self, room_id, start_time='2023-11-21 00:00:00', end_time='2023-11-22 15:45:32'):
         '''
         查看某个房间的详单'api/logs/get_ac_info/'
+        :return: (是否找到, 该房间的记录)，日志服务不可用时返回 (False, None)
         '''
-        data = {
-            'start_time': start_time,
-            'end_time': end_time
-        }
-        response = requests.post('http://10.129.67.27:8000/api/logs/get_ac_info/',
-                                 data=data
-                                 )
-        output = json.loads(response.content)['detail']
-        for dict in output:
-            if (dict['roomNumber'] == '房间101'):
-                detial = dict
-        print(detial)
-
-        return True, data
+        try:
+            output = log_client.call(log_client.get_ac_info, start_time, end_time).get('detail', [])
+        except LogServiceError as e:
+            logger.warning('log service unavailable: %s', e)
+            return False, None
+        detail = next((item for item in output if item.get('roomNumber') == f'房间{room_id}'), None)
+        logger.debug('ac info of room %s: %s', room_id, detail)
+        return detail is not None, detail
 
     def check_all_log(self):
-        response = requests.get('http://se.dahuangggg.me/api/logs/get_all_logs/')
-        data = json.loads(response.content)['log']
-        return data
+        try:
+            return log_client.call(log_client.get_all_logs).get('log', [])
+        except LogServiceError as e:
+            logger.warning('log service unavailable: %s', e)
+            return []
 
     def check_room_expense(self, room_id, token):
-        # response = requests.get(f'http://{PATH}/room-details/{int(room_id)}', headers=headers)
-        # if response.status_code != 200:
-        #     return []
-        # data = json.loads(response.content)['roomDetails']
-        return {'data':[1,2]}
+        """
+        房间本次入住的空调费用
+        """
+        return room_expense(token, room_id)
 
     def getoperate(self,name):
         """
@@ -972,9 +2346,9 @@ class hotel_data():
         temp_upper_limit = result['maxTemperature']
         temp_lower_limit = result['minTemperature']
         work_mode = result['acMode']
-        rate = result['rate']
-        speed_rates = {'low': rate, 'medium': rate, 'high': rate}
-        print('get_mode:',work_mode)
+        rates = result['rates']
+        speed_rates = {'low': rates['LOW'], 'medium': rates['MEDIUM'], 'high': rates['HIGH']}
+        logger.debug('get_mode: %s', work_mode)
         return temp_upper_limit, temp_lower_limit, work_mode, speed_rates
 
     def operate_set(self, token, temp_upper_limit, temp_lower_limit, work_mode, rate_low, rate_medium, rate_high):
@@ -984,7 +2358,8 @@ class hotel_data():
 
         data = {
             'token':token,
-            'rate':rate_low,
+            'rate':rate_medium,
+            'rates':{'LOW': rate_low, 'MEDIUM': rate_medium, 'HIGH': rate_high},
             'defaultFanSpeed':'MEDIUM',
             'defaultTemperature':24,
             'acMode':work_mode,
@@ -992,7 +2367,7 @@ class hotel_data():
             'minTemperature':temp_lower_limit,
         }
         if change_settings(data=data):
-            print('更改成功')
+            logger.info('更改成功')
             return True
         else:
             return False
@@ -1038,7 +2413,7 @@ def submit():
     try:
         # 申请数据库对应的内容，返回字典与是否正确，不正确则弹出错误转到except部分
         dic = log_data(username, password, roll)
-        print(dic.verification)
+        logger.debug('login verification %s', dic.verification)
         if dic.verification == True and dic.identify == True:
             # 如果正确，则依据身份不同建立对应的session，包括房间号等
             session['username'] = username
@@ -1093,7 +2468,7 @@ def query():
             action = request.args.get('action')
             dic = hotel_data(session['username'])
             dic.room(session['token'])
-            print(dic.room_id, dic.used_id, dic.used_id)
+            logger.debug('%s %s', dic.room_id, dic.used_id)
             if action == 'check_in':
                 return render_template('query.html', list1=dic.room_id, list2=dic.nused_id, message='该房间已被使用',
                                        target_url='/receptionist/check_in')
@@ -1129,7 +2504,7 @@ def check_in():
                 room_id = request.form['roomNumber']
                 user_name = request.form['user_name']
                 dic = hotel_data('username')
-                print(password, room_id, user_name)
+                logger.debug('check in %s to room %s', user_name, room_id)
                 try:
                     if dic.check_in(roomNumber=room_id, password=password, token=session['token'], user_name=user_name):
                         return render_template('good_check_in.html', roomNumber=room_id)
@@ -1159,14 +2534,11 @@ def check_out():
         else:
             dic = hotel_data(session['username'])
             room_id = request.args.get('element')
-            judgment, data = dic.check_out(room_id, session['token'])
+            judgment, session_id = dic.check_out(room_id, session['token'])
             if judgment:
-                # 创建Excel文件
-                df = pd.DataFrame(data)
-                filename = f'checkout_{room_id}.xlsx'
-                df.to_excel(filename, index=False)
-                # 在session中存储文件名
-                session['excel_filename'] = filename
+                # 在session中记下要导出的入住会话，下载时直接从数据库流式生成
+                session['receipt_session_id'] = session_id
+                session['receipt_room_id'] = room_id
                 return render_template('good_check_out.html', room_id=room_id)
             else:
                 return '房间号不正确或网络错误'
@@ -1179,12 +2551,17 @@ def check_out():
 
 @hotel_receptionist.route('/download_excel')
 def download_excel():
-    filename = session['excel_filename']
-    if filename and os.path.exists(filename):
-        response = send_file(filename, as_attachment=True)
-        return response
-    else:
+    """
+    下载详单：不落盘，直接把 CSV 行写进响应
+    """
+    if 'username' not in session or session['identification'] == '客户':
+        return redirect(url_for('log_and_submit.log_and_submit_login'))
+    session_id = session.get('receipt_session_id')
+    if session_id is None:
         return "文件不存在", 404
+    filename = f"receipt_{session.get('receipt_room_id')}.csv"
+    return Response(stream_with_context(receipt_rows(session_id)), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 
 @hotel_receptionist.route('/query_all')
@@ -1219,13 +2596,11 @@ def print_receipt():
         else:
             dic = hotel_data(session['username'])
             room_id = request.args.get('element')
-            data = dic.check_room_expense(room_id, session['token'])
-            if data:
-                df = pd.DataFrame(data)
-                filename = f'checkout_{room_id}.xlsx'
-                df.to_excel(filename, index=False)
-                # 在session中存储文件名
-                session['excel_filename'] = filename
+            session_id = dic.customer_session(room_id)
+            if session_id:
+                # 在session中记下要导出的入住会话，下载时直接从数据库流式生成
+                session['receipt_session_id'] = session_id
+                session['receipt_room_id'] = room_id
                 return render_template('print_receipt.html', room_id=room_id)
             else:
                 return '房间号不正确或网络错误'
@@ -1283,7 +2658,7 @@ def operate_set():
                     rate_low = request.form.get('rateLow')
                     rate_medium = request.form.get('rateMedium')
                     rate_high = request.form.get('rateHigh')
-                    print(temp_upper_limit, temp_lower_limit, work_mode, rate_low, rate_medium, rate_high)
+                    logger.debug('settings %s %s %s %s %s %s', temp_upper_limit, temp_lower_limit, work_mode, rate_low, rate_medium, rate_high)
                     if not dic.operate_set(session['username'],temp_upper_limit, temp_lower_limit, work_mode, rate_low, rate_medium,
                                            rate_high):
                         raise Exception("Verification failed")
@@ -1325,7 +2700,7 @@ def query_all_room_detail():
             return redirect(url_for('customer.homepage'))
         else:
             dic = hotel_data(session['username'])
-            rooms = dic.query_all_room()
+            rooms = dic.query_all_room(session['token'])
             return render_template('query_all_rooms.html', rooms=rooms)
 
     else:
@@ -1333,6 +2708,23 @@ def query_all_room_detail():
         return redirect(url_for('log_and_submit.log_and_submit_login'))
 
 
+@hotel_receptionist.route('/stream')
+def stream():
+    """
+    所有房间温度、队列状态的实时推送（Server-Sent Events）
+    :return: text/event-stream
+    """
+    if 'username' not in session:
+        return redirect(url_for('log_and_submit.log_and_submit_login'))
+    if session['identification'] == '客户':
+        abort(401, "Unauthorized")
+    scheduler.start_publisher(current_app._get_current_object())
+    subscription = scheduler.events.subscribe()
+    initial = sse_message('rooms', rooms_snapshot())
+    return Response(scheduler.events.stream(subscription, initial), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 customer = Blueprint('customer', __name__)
 
 base_data = {
@@ -1355,9 +2747,8 @@ def homepage():
     """
     if 'username' in session:
         if session['identification'] == '客户':
-            function = hotel_data('')
-            session['room_temp'] = function.update_ac(session['room_id'], request.form.to_dict(), session['token'])
-            return render_template('customer_homepage.html', room_temp=session['room_temp'])
+            # 实时温度由 /customer/stream 推送，这里只渲染页面
+            return render_template('customer_homepage.html', room_temp=session.get('room_temp'))
         else:
             return render_template('customer_homepage.html')
 
@@ -1368,6 +2759,26 @@ def homepage():
         return redirect(url_for('log_and_submit.log_and_submit_login'))
 
 
+@customer.route('/stream')
+def stream():
+    """
+    自己房间温度、队列状态的实时推送（Server-Sent Events）
+    :return: text/event-stream
+    """
+    if 'username' not in session:
+        return redirect(url_for('log_and_submit.log_and_submit_login'))
+    if session['identification'] != '客户' or 'room_id' not in session:
+        return jsonify({'msg': '请先登记入住'}), 404
+    room = db.session.query(Room).filter_by(roomName=session['room_id']).one_or_none()
+    if room is None:
+        abort(404, "room not found")
+    scheduler.start_publisher(current_app._get_current_object())
+    subscription = scheduler.events.subscribe(room.roomID)
+    initial = sse_message('room', room_status(room, settings_cache.get(), datetime.now()))
+    return Response(scheduler.events.stream(subscription, initial), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @customer.route('/open_condition')
 def open_condition():
     """
@@ -1389,15 +2800,11 @@ def open_condition():
 
 @customer.route('/air_conditioner/', methods=['POST'])
 def post():
-    print('start')
-    print(request.form.to_dict())
-    print(session)
+    logger.debug('air conditioner request: %s', request.form.to_dict())
     if 'username' in session:
-        print('username')
         if session['identification'] == '客户':
             if 'room_id' in session:
                 function = hotel_data('')
-                print(session)
                 session['room_temp'] = function.update_ac(session['room_id'], request.form.to_dict(), session['token'])
                 return jsonify({'msg': '成功'}), 200
             else:
@@ -1442,9 +2849,147 @@ def change():
         return redirect(url_for('log_and_submit.log_and_submit_login'))
 
 
-# 注册蓝图
-app.register_blueprint(log_and_submit, url_prefix='/')
-app.register_blueprint(customer, url_prefix='/customer')
-app.register_blueprint(hotel_receptionist, url_prefix='/receptionist')
+counted_engines = weakref.WeakSet()  # 已注册统计的 engine，create_app 多次调用时不重复注册
+
+
+def count_queries(engine):
+    # 统计执行的 SQL 语句数，请求中执行的同时按耗时和语句形状计入该请求
+    if engine in counted_engines:
+        return
+    counted_engines.add(engine)
+    timed(engine, record_query, key='request_queries')
+
+
+def record_query(statement, seconds):
+    if has_request_context():
+        if 'queries' in g:
+            g.queries.record(statement, seconds)
+        DB_QUERIES.inc('request')
+    else:
+        DB_QUERIES.inc('background')
+
+
+def before_request():
+    g.request_start = time.perf_counter()
+    g.queries = QueryLog()
+
+
+def check_query_budget(endpoint, queries):
+    """
+    视图函数用 @query_budget(n) 声明的语句数上限，以及重复 QUERY_REPEAT_THRESHOLD 次以上的同形状语句（N+1）
+    严格模式（QUERY_BUDGET_STRICT，默认在调试和测试时开启）下抛出 QueryBudgetExceeded，否则记录警告
+    """
+    view = current_app.view_functions.get(endpoint)
+    problems = queries.problems(getattr(view, 'query_budget', None), current_app.config['QUERY_REPEAT_THRESHOLD'])
+    if not problems:
+        return
+    message = f'{endpoint}: ' + '; '.join(problems)
+    strict = current_app.config['QUERY_BUDGET_STRICT']
+    if strict or (strict is None and (current_app.debug or current_app.testing)):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def after_request(response):
+    if 'request_start' in g:
+        endpoint = request.endpoint or 'unknown'
+        REQUEST_LATENCY.observe(time.perf_counter() - g.request_start, endpoint, request.method, response.status_code)
+        REQUEST_QUERIES.observe(g.queries.count, endpoint)
+        if current_app.debug or current_app.testing:
+            response.headers['Server-Timing'] = f'db;dur={g.queries.seconds * 1e3:.2f};desc="{g.queries.count} queries"'
+        check_query_budget(endpoint, g.queries)
+    return response
+
+
+def create_app(config=None):
+    """
+    应用工厂：只创建应用、读取配置、注册蓝图，不访问数据库也不启动调度器
+        >> app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///test.db'})
+    """
+    app = Flask(__name__)
+    app.config['SESSION_TYPE'] = 'filesystem'
+    app.config['SECRET_KEY'] = os.environ.get('HOTEL_SECRET_KEY') or os.urandom(24)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('HOTEL_DATABASE_URI', 'sqlite:///hotel.db')
+    app.config['SCHEDULER_ENABLED'] = os.environ.get('HOTEL_SCHEDULER') == '1'  # 创建应用时是否同时启动调度器
+    # 密码哈希的迭代次数，可用 python -m benchmarks.bench_login 按登录峰值选择
+    app.config['PASSWORD_HASH_ITERATIONS'] = int(os.environ.get('HOTEL_PASSWORD_ITERATIONS', 200_000))
+    # SQLite 的 PRAGMA 组合（见 utils/sqlite_profile.py）：default / wal / wal-durable
+    app.config['SQLITE_PROFILE'] = os.environ.get('HOTEL_SQLITE_PROFILE', 'wal')
+    # 远程日志服务的地址和单次调用最长等待时间（秒）
+    app.config['LOG_SERVICE_URL'] = os.environ.get('HOTEL_LOG_SERVICE_URL', 'http://se.dahuangggg.me')
+    app.config['LOG_SERVICE_DEADLINE'] = float(os.environ.get('HOTEL_LOG_SERVICE_DEADLINE', 5.))
+    # 每个请求的 SQL 语句预算：同形状语句重复多少次视为 N+1；是否在超出时使请求失败（默认调试和测试时）
+    app.config['QUERY_REPEAT_THRESHOLD'] = int(os.environ.get('HOTEL_QUERY_REPEAT_THRESHOLD', 5))
+    strict = os.environ.get('HOTEL_QUERY_BUDGET_STRICT')
+    app.config['QUERY_BUDGET_STRICT'] = None if strict is None else strict == '1'
+    # 是否开放 /api/debug/profiler
+    app.config['PROFILER_ENABLED'] = os.environ.get('HOTEL_PROFILER') == '1'
+    if config:
+        app.config.update(config)
+    password_hasher.iterations = app.config['PASSWORD_HASH_ITERATIONS']
+    log_client.base_url = app.config['LOG_SERVICE_URL']
+    log_client.deadline = app.config['LOG_SERVICE_DEADLINE']
+    sqlite = is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']) and ':memory:' not in app.config['SQLALCHEMY_DATABASE_URI']
+    if sqlite:
+        assert app.config['SQLITE_PROFILE'] in PROFILES, f"unknown SQLITE_PROFILE {app.config['SQLITE_PROFILE']}"
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLITE_PROFILE']))
+    CORS(app)
+    db.init_app(app)
+    with app.app_context():
+        if sqlite:
+            install_pragmas(db.engine, app.config['SQLITE_PROFILE'])
+        count_queries(db.engine)
+    app.before_request(before_request)
+    app.after_request(after_request)
+
+    # 注册蓝图
+    app.register_blueprint(api)
+    app.register_blueprint(log_and_submit, url_prefix='/')
+    app.register_blueprint(customer, url_prefix='/customer')
+    app.register_blueprint(hotel_receptionist, url_prefix='/receptionist')
+
+    if app.config['SCHEDULER_ENABLED']:
+        init_db(app)
+        start_scheduler(app)
+    return app
+
+
+def start_scheduler(app):
+    """
+    在当前进程中启动空调调度器（每个部署只应有一个进程调用）
+    """
+    scheduler.start(app)
+    return scheduler
+
+
+@api.cli.command('init-db')
+def init_db_command():
+    """
+    建表并写入初始数据：flask --app end init-db
+    """
+    init_db(current_app)
+    click.echo('database initialized')
+
+
+@api.cli.command('run-scheduler')
+def run_scheduler_command():
+    """
+    以独立进程运行调度器：flask --app end run-scheduler
+    """
+    app = current_app._get_current_object()
+    init_db(app)
+    start_scheduler(app)
+    click.echo('scheduler started, press Ctrl+C to stop')
+    try:
+        scheduler.join()
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
 if __name__ == '__main__':
+    app = create_app()
+    # debug 模式下 reloader 的监控进程不启动调度器，只在实际处理请求的子进程中启动
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        init_db(app)
+        start_scheduler(app)
     app.run(debug=True, host='0.0.0.0',port=3000)
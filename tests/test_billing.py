@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from end import ACScheduler
+from utils.billing import aggregate, ledger_entries
+from utils.clock import SimulatedClock
+from utils.enums import FanSpeed
+from utils.storage import MemorySettings, MemoryStorage
+
+
+def test_fan_speed_change_splits_the_segment():
+    # 运行中从 LOW 调到 HIGH：两条详单各自的风速、费率，能耗等于实际的温度改变量
+    storage = MemoryStorage(MemorySettings(rates={FanSpeed.LOW: 1., FanSpeed.HIGH: 4.}))
+    room = storage.add_room(initialTemperature=30., acTemperature=16, fanSpeed=FanSpeed.LOW,
+                            customerSessionID='guest-1')
+    clock = SimulatedClock()
+    scheduler = ACScheduler(storage, clock=clock)
+    scheduler.inbox.submit('turn_on', room.roomID)
+    clock.advance(1.)
+    scheduler.update()
+    start = scheduler.state.get(room.roomID).roomTemperature
+    for speed in (FanSpeed.LOW, FanSpeed.HIGH):
+        room.fanSpeed = speed
+        scheduler.inbox.submit('sync', room.roomID)
+        for _ in range(5):
+            clock.advance(1.)
+            scheduler.update()
+    scheduler.inbox.submit('turn_off', room.roomID)
+    scheduler.update()
+    scheduler.records.drain()
+
+    cooled = start - scheduler.state.get(room.roomID).roomTemperature
+    records = [record for record in storage.records if record.consumption]
+    assert [(record.fanSpeed, record.rate) for record in records] == [('LOW', 1.), ('HIGH', 4.)]
+    assert abs(sum(entry['energy'] for entry in storage.entries) - cooled) < 1e-9
+    assert abs(storage.totals['guest-1'].amount - sum(record.consumption for record in records)) < 1e-9
+    assert abs(sum(usage.energy for usage in storage.usage_rollups.values()) - cooled) < 1e-9
+
+
+def record(sessionID, roomID, end, consumption, energy, fanSpeed='MEDIUM'):
+    start = end - timedelta(minutes=5)
+    return dict(roomID=roomID, customSessionID=sessionID, requestTime=start, serveStartTime=start, serveEndTime=end,
+                fanSpeed=fanSpeed, acMode='COOL', rate=consumption / energy, consumption=consumption, energy=energy,
+                accumulatedConsumption=consumption, turnedOn=False)
+
+
+def test_ledger_skips_records_outside_a_stay():
+    entries = ledger_entries([record('guest-1', 1, datetime(2024, 1, 1, 8, 30), 2., 1.),
+                              record(None, 2, datetime(2024, 1, 1, 8, 30), 3., 1.)])
+    assert [(entry['customerSessionID'], entry['amount'], entry['energy']) for entry in entries] == [('guest-1', 2., 1.)]
+
+
+def test_aggregate_by_session_hour_and_day():
+    records = [record('guest-1', 1, datetime(2024, 1, 1, 8, 30), 2., 1.),
+               record('guest-1', 1, datetime(2024, 1, 1, 9, 10), 4., 1.),
+               record('guest-2', 2, datetime(2024, 1, 1, 9, 20), 1., 0.5)]
+    totals, rollups = aggregate(ledger_entries(records))
+    assert totals == {'guest-1': [1, 2., 6., 2], 'guest-2': [2, 0.5, 1., 1]}
+    assert rollups[('hour', datetime(2024, 1, 1, 8), 1)] == [1., 2., 1]
+    assert rollups[('hour', datetime(2024, 1, 1, 9), 1)] == [1., 4., 1]
+    assert rollups[('day', datetime(2024, 1, 1), 1)] == [2., 6., 2]
+    assert rollups[('day', datetime(2024, 1, 1), 2)] == [0.5, 1., 1]
+
+
+def test_memory_storage_keeps_running_totals():
+    storage = MemoryStorage()
+    storage.insert_records([record('guest-1', 1, datetime(2024, 1, 1, 8, 30), 2., 1.)])
+    storage.insert_records([record('guest-1', 1, datetime(2024, 1, 2, 8, 30), 4., 2.)])
+    total = storage.billing_total('guest-1')
+    assert (total.amount, total.energy, total.entries) == (6., 3., 2)
+    days = storage.revenue('day', start=datetime(2024, 1, 1), end=datetime(2024, 1, 3))
+    assert [(rollup.periodStart.day, rollup.amount) for rollup in days] == [(1, 2.), (2, 4.)]
@@ -0,0 +1,55 @@
+from utils.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+def test_items_expire_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set('a', 1)
+    clock.now = 9.9
+    assert cache.get('a') == 1
+    clock.now = 10.
+    assert cache.get('a') is None
+    assert len(cache) == 0  # 过期项在读取时删除
+    assert cache.stats() == dict(size=0, hits=1, misses=1)
+
+
+def test_set_restarts_the_ttl():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set('a', 1)
+    clock.now = 8.
+    cache.set('a', 2)
+    clock.now = 15.
+    assert cache.get('a') == 2
+
+
+def test_least_recently_used_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=10, clock=FakeClock())
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+
+def test_get_or_load_does_not_cache_none():
+    cache = TTLCache(clock=FakeClock())
+    calls = []
+
+    def load():
+        calls.append(1)
+        return None if len(calls) == 1 else 'value'
+
+    assert cache.get_or_load('a', load) is None
+    assert cache.get_or_load('a', load) == 'value'
+    assert cache.get_or_load('a', load) == 'value'
+    assert len(calls) == 2
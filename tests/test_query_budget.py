@@ -0,0 +1,63 @@
+import logging
+
+import pytest
+from sqlalchemy import text
+
+from end import create_app, db
+from utils.query_budget import QueryBudgetExceeded, assert_max_queries, query_budget, statement_shape
+
+
+def app_with_views(tmp_path, **config):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "hotel.db"}', 'TESTING': True, **config})
+
+    @app.route('/budget/<int:n>')
+    @query_budget(2)
+    def within_budget(n):
+        for _ in range(n):
+            db.session.execute(text('SELECT 1')).scalar()
+        return 'ok'
+
+    @app.route('/n-plus-one')
+    def n_plus_one():
+        for roomID in range(6):  # 同形状、不同参数的语句
+            db.session.execute(text(f'SELECT {roomID}')).scalar()
+        return 'ok'
+
+    return app
+
+
+def test_statement_shape_ignores_literals_and_in_list_length():
+    assert statement_shape("SELECT * FROM room WHERE id = 3 AND name = 'a'") == \
+        statement_shape("SELECT * FROM room WHERE id = 42 AND name = 'bb'")
+    assert statement_shape('SELECT * FROM room WHERE id IN (?, ?)') == \
+        statement_shape('SELECT * FROM room WHERE id IN (?, ?, ?, ?)')
+
+
+def test_strict_in_testing(tmp_path):
+    client = app_with_views(tmp_path).test_client()
+    response = client.get('/budget/2')
+    assert response.status_code == 200
+    assert 'desc="2 queries"' in response.headers['Server-Timing']
+    with pytest.raises(QueryBudgetExceeded, match='3 queries exceed the budget of 2'):
+        client.get('/budget/3')
+    with pytest.raises(QueryBudgetExceeded, match='6x SELECT'):
+        client.get('/n-plus-one')
+
+
+def test_warning_when_not_strict(tmp_path, caplog):
+    client = app_with_views(tmp_path, QUERY_BUDGET_STRICT=False).test_client()
+    with caplog.at_level(logging.WARNING, logger='end'):
+        assert client.get('/budget/3').status_code == 200
+    assert 'within_budget: 3 queries exceed the budget of 2' in caplog.text
+
+
+def test_assert_max_queries(tmp_path):
+    app = app_with_views(tmp_path)
+    with app.app_context():
+        with assert_max_queries(db.engine, 2) as log:
+            db.session.execute(text('SELECT 1'))
+        assert log.count == 1
+        with pytest.raises(QueryBudgetExceeded):
+            with assert_max_queries(db.engine, 10, repeat_threshold=3):
+                for value in range(3):
+                    db.session.execute(text(f'SELECT {value}'))
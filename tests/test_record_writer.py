@@ -0,0 +1,14 @@
+from utils.record_writer import BatchWriter
+
+
+def test_restart_after_stop():
+    written = []
+    writer = BatchWriter(written.extend, interval=0.01)
+    writer.start()
+    writer.submit(1)
+    writer.stop()
+    writer.start()  # ACScheduler.start() -> stop() -> start()
+    assert writer.thread.is_alive()
+    writer.submit(2)
+    writer.stop()
+    assert written == [1, 2]
@@ -0,0 +1,64 @@
+from end import ACScheduler
+from utils.clock import SimulatedClock
+from utils.enums import QueueState
+from utils.storage import MemoryStorage
+
+
+def running_scheduler():
+    # 一个正在运行、已经产生费用的房间
+    storage = MemoryStorage()
+    room = storage.add_room(initialTemperature=30., acTemperature=20, customerSessionID='guest-1')
+    clock = SimulatedClock()
+    scheduler = ACScheduler(storage, clock=clock)
+    scheduler.inbox.submit('turn_on', room.roomID)
+    for _ in range(3):
+        clock.advance(1.)
+        scheduler.update()
+    assert scheduler.state.get(room.roomID).queueState == QueueState.RUNNING
+    assert scheduler.state.get(room.roomID).consumption > 0
+    return storage, scheduler, clock, room
+
+
+def check_out(room):
+    # 与 account_delete 相同：请求线程提交退房后的行
+    room.customerSessionID = None
+    room.checkInTime = None
+    room.queueState = QueueState.IDLE
+    room.consumption = 0.0
+
+
+def test_flush_between_check_out_and_reset():
+    storage, scheduler, clock, room = running_scheduler()
+    check_out(room)
+    scheduler.flush()  # 退房提交之后、reset 执行之前的一次写回，把旧的 RUNNING 状态和费用写回了行
+    assert room.queueState == QueueState.RUNNING
+
+    scheduler.inbox.submit('reset', room.roomID)
+    clock.advance(1.)
+    scheduler.update()
+
+    state = scheduler.state.get(room.roomID)
+    assert state.queueState == QueueState.IDLE
+    assert state.consumption == 0.0
+    assert state.firstRuntime is None
+    assert state.customerSessionID is None
+    assert room.roomID not in scheduler.running_list
+    # reset 所在的这次调度立即写回，不等 flush_interval
+    assert (room.queueState, room.consumption, room.firstRuntime) == (QueueState.IDLE, 0.0, None)
+
+
+def test_reset_keeps_running_slots_consistent():
+    # 重置后的房间不再占用运行名额，下一位客人开机时从零计费
+    storage, scheduler, clock, room = running_scheduler()
+    check_out(room)
+    scheduler.flush()
+    room.customerSessionID = 'guest-2'
+    scheduler.inbox.submit('reset', room.roomID)
+    scheduler.inbox.submit('turn_on', room.roomID)
+    clock.advance(1.)
+    scheduler.update()
+
+    state = scheduler.state.get(room.roomID)
+    assert list(scheduler.running_list) == [room.roomID]
+    assert state.customerSessionID == 'guest-2'
+    assert state.consumption < 1.
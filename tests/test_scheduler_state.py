@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from benchmarks.bench_thermal import BOOST, COOLING_RATE, RATES, get_speed, make_rooms, reference_step, vectorized_step
+from utils.enums import FanSpeed, QueueState
+from utils.scheduler_state import SchedulerState
+
+
+def loaded(rooms):
+    state = SchedulerState(get_speed)
+    state.load(rooms)
+    return state
+
+
+def test_heat_and_drift_match_the_per_room_loop():
+    rooms = make_rooms(500, running_ratio=0.3, seed=3)
+    state = loaded(make_rooms(500, running_ratio=0.3, seed=3))
+    for _ in range(40):
+        assert sorted(reference_step(rooms, 1.)) == sorted(vectorized_step(state, 1.))
+    assert np.array_equal(np.array([room.roomTemperature for room in rooms]), state.roomTemperature[:500])
+    assert np.array_equal(np.array([room.consumption for room in rooms]), state.consumption[:500])
+    assert [room.queueState for room in rooms] == [view.queueState for view in state.views()]
+
+
+def test_heat_charges_each_fan_speed_its_own_rate():
+    rooms = make_rooms(3, running_ratio=1., seed=1)
+    for room, speed in zip(rooms, FanSpeed):
+        room.fanSpeed, room.roomTemperature, room.acTemperature = speed, 30., 20
+    state = loaded(rooms)
+    assert state.heat(1., BOOST, RATES) == []
+    for view, speed in zip(state.views(), FanSpeed):
+        assert view.energy == pytest.approx(30. - view.roomTemperature)
+        assert view.energy == pytest.approx(get_speed(speed) / 60 * BOOST)
+        assert view.consumption == pytest.approx(view.energy * RATES[speed])
+
+
+def test_drift_only_moves_rooms_that_are_not_running():
+    rooms = make_rooms(2, seed=2)
+    for room, queueState in zip(rooms, (QueueState.RUNNING, QueueState.PENDING)):
+        room.queueState, room.roomTemperature, room.initialTemperature = queueState, 20., 30.
+    state = loaded(rooms)
+    state.drift(10., BOOST, COOLING_RATE)
+    running, pending = state.views()
+    assert running.roomTemperature == 20.
+    assert pending.roomTemperature == 20. + COOLING_RATE * 10. * BOOST
+    state.drift(1e6, BOOST, COOLING_RATE)  # 不会越过初始温度
+    assert pending.roomTemperature == 30.
+
+
+def test_pop_dirty_returns_scheduler_columns_once():
+    state = loaded(make_rooms(4, running_ratio=1., seed=4))
+    state.heat(1., BOOST, RATES)
+    mappings = state.pop_dirty()
+    assert {mapping['roomID'] for mapping in mappings} == {1, 2, 3, 4}
+    assert set(mappings[0]) == {'roomID', 'roomTemperature', 'queueState', 'consumption', 'firstRuntime'}
+    assert state.pop_dirty() == []
@@ -0,0 +1,74 @@
+import random
+
+from utils.waiting_queue import IndexedPriorityQueue
+
+
+def drain(queue):
+    return [queue.pop()[0] for _ in range(len(queue))]
+
+
+def test_equal_priorities_pop_in_arrival_order():
+    queue = IndexedPriorityQueue()
+    for roomID in (5, 3, 9, 1):
+        queue.push(roomID, 3)
+    assert drain(queue) == [5, 3, 9, 1]
+
+
+def test_lower_priority_value_first_then_fifo():
+    queue = IndexedPriorityQueue()
+    for roomID, priority in ((1, 3), (2, 1), (3, 3), (4, 1), (5, 2)):
+        queue.push(roomID, priority)
+    assert drain(queue) == [2, 4, 5, 1, 3]
+
+
+def test_update_keeps_arrival_order_within_priority():
+    queue = IndexedPriorityQueue()
+    for roomID in (1, 2, 3, 4):
+        queue.push(roomID, 3)
+    queue.update(3, 1)
+    queue.update(1, 2)
+    queue.update(3, 3)  # 调回原优先级后仍排在原来的位置
+    assert queue.priority(1) == 2
+    assert drain(queue) == [1, 2, 3, 4]
+
+
+def test_push_existing_key_updates_priority():
+    queue = IndexedPriorityQueue()
+    queue.push(1, 3)
+    queue.push(2, 3)
+    queue.push(2, 1)
+    assert len(queue) == 2
+    assert drain(queue) == [2, 1]
+
+
+def test_remove():
+    queue = IndexedPriorityQueue()
+    for roomID in range(10):
+        queue.push(roomID, roomID % 3)
+    assert queue.remove(4)
+    assert not queue.remove(4)
+    assert 4 not in queue and 5 in queue
+    assert drain(queue) == [0, 3, 6, 9, 1, 7, 2, 5, 8]
+
+
+def test_matches_sorted_order_under_random_operations():
+    # 与按 (优先级, 入队顺序) 排序的参考实现比较
+    rng = random.Random(7)
+    queue, reference, sequence = IndexedPriorityQueue(), {}, 0
+    for _ in range(2000):
+        roomID = rng.randrange(50)
+        action = rng.random()
+        if action < 0.5:
+            if roomID in reference:
+                reference[roomID][0] = priority = rng.randrange(4)
+            else:
+                priority = rng.randrange(4)
+                reference[roomID] = [priority, sequence]
+                sequence += 1
+            queue.push(roomID, priority)
+        elif action < 0.75:
+            assert queue.remove(roomID) == (reference.pop(roomID, None) is not None)
+        elif reference:
+            expected = min(reference, key=lambda key: reference[key])
+            assert queue.pop() == (expected, reference.pop(expected)[0])
+    assert drain(queue) == sorted(reference, key=lambda key: reference[key])
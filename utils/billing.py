@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from utils.enums import FanSpeed
+
+# 汇总表的粒度：按小时、按天
+GRANULARITIES = ('hour', 'day')
+
+
+def period_start(moment: datetime, granularity):
+    # moment 所在小时/天的起点
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f'unknown granularity {granularity}')
+
+
+def speed_rates(rate, rates=None):
+    """
+    每种风速的费率（每单位温度改变的费用），没有单独设置的风速使用统一费率 rate
+    :param rates: {FanSpeed 或风速名称: 费率}
+    """
+    rates = {(speed if isinstance(speed, FanSpeed) else FanSpeed[speed]): value
+             for speed, value in (rates or {}).items() if value is not None}
+    return {speed: float(rates.get(speed, rate)) for speed in FanSpeed}
+
+
+def ledger_entries(records):
+    """
+    详单 -> 账目：每段服务一条，只记入住会话中的服务（未入住的房间不计费）
+    服务时长跨越整点时整段记在结束时刻所在的小时/天
+    """
+    return [dict(customerSessionID=record['customSessionID'], roomID=record['roomID'],
+                 createTime=record['serveEndTime'], fanSpeed=record['fanSpeed'], rate=record['rate'],
+                 energy=record['energy'],
+                 amount=record['consumption'])
+            for record in records if record['customSessionID'] is not None]
+
+
+def aggregate(entries):
+    """
+    把一批账目合并为会话总额和小时/天汇总的增量，每个键只需更新一行
+    :return: ({customerSessionID: [roomID, energy, amount, entries]},
+              {(granularity, periodStart, roomID): [energy, amount, entries]})
+    """
+    totals, rollups = {}, {}
+    for entry in entries:
+        total = totals.setdefault(entry['customerSessionID'], [entry['roomID'], 0., 0., 0])
+        total[1] += entry['energy']
+        total[2] += entry['amount']
+        total[3] += 1
+        for granularity in GRANULARITIES:
+            key = (granularity, period_start(entry['createTime'], granularity), entry['roomID'])
+            rollup = rollups.setdefault(key, [0., 0., 0])
+            rollup[0] += entry['energy']
+            rollup[1] += entry['amount']
+            rollup[2] += 1
+    return totals, rollups
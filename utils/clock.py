@@ -0,0 +1,33 @@
+import time
+from datetime import datetime, timedelta
+
+
+class SystemClock:
+    """
+    调度器使用的时钟：time() 返回秒数（用于计算时间间隔），now() 返回当前时间（写入数据库）
+    """
+
+    def time(self):
+        return time.time()
+
+    def now(self):
+        return datetime.now()
+
+
+class SimulatedClock:
+    """
+    仿真时钟，只在 advance 时前进，用于加速回放
+    """
+
+    def __init__(self, start=datetime(2024, 1, 1)):
+        self.start = start
+        self.elapsed = 0.  # 自 start 起经过的秒数
+
+    def time(self):
+        return self.start.timestamp() + self.elapsed
+
+    def now(self):
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def advance(self, seconds):
+        self.elapsed += seconds
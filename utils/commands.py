@@ -0,0 +1,59 @@
+import queue
+from concurrent.futures import Future
+
+
+class Command:
+    """
+    发给调度器的一条命令，future 在命令被执行（或转发给主调度器）后完成
+    """
+    __slots__ = ('name', 'roomID', 'future')
+
+    def __init__(self, name, roomID):
+        self.name = name
+        self.roomID = roomID
+        self.future = Future()
+
+    def __repr__(self):
+        return f'Command({self.name!r}, {self.roomID!r})'
+
+
+class CommandInbox:
+    """
+    请求线程与调度线程之间的有界命令队列：请求线程放入命令后立即返回，
+    调度线程在每次调度开始时批量取出执行
+    """
+
+    def __init__(self, maxsize=1000):
+        self.queue = queue.Queue(maxsize)
+        self.accepted = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return self.queue.qsize()
+
+    def submit(self, name, roomID):
+        """
+        不阻塞；队列已满时返回 None
+        :return: 命令的 Future
+        """
+        command = Command(name, roomID)
+        try:
+            self.queue.put_nowait(command)
+        except queue.Full:
+            self.rejected += 1
+            return None
+        self.accepted += 1
+        return command.future
+
+    def take(self, limit=None):
+        # 取出队列中的命令，最多 limit 条
+        commands = []
+        while limit is None or len(commands) < limit:
+            try:
+                commands.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return commands
+
+    def stats(self):
+        return dict(pending=len(self), accepted=self.accepted, rejected=self.rejected)
@@ -0,0 +1,104 @@
+import json
+import queue
+import threading
+
+
+def sse_message(event, data):
+    # 编码为一条 Server-Sent Events 消息
+    return f'event: {event}\ndata: {json.dumps(data, default=str, ensure_ascii=False)}\n\n'
+
+
+class Subscription:
+    """
+    一个推送连接，roomID 为 None 时订阅所有房间
+    """
+
+    def __init__(self, roomID=None, maxsize=64):
+        self.roomID = roomID
+        self.queue = queue.Queue(maxsize)
+        self.closed = False
+
+    def put(self, message):
+        # 客户端消费太慢导致队列已满时关闭连接，由客户端（EventSource）自动重连
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.closed = True
+
+    def get(self, timeout=None):
+        return self.queue.get(timeout=timeout)
+
+
+class RoomEventHub:
+    """
+    房间状态推送：调度器每次调度后把变化的房间发布一次，
+    每条消息只编码一次，再分发给所有订阅者
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.rooms = {}  # roomID -> {Subscription}
+        self.all = set()  # 订阅所有房间的连接
+
+    def __len__(self):
+        with self.lock:
+            return len(self.all) + sum(len(subscriptions) for subscriptions in self.rooms.values())
+
+    def has_subscribers(self):
+        return bool(self.all or self.rooms)
+
+    def subscribe(self, roomID=None):
+        subscription = Subscription(roomID, self.maxsize)
+        with self.lock:
+            if roomID is None:
+                self.all.add(subscription)
+            else:
+                self.rooms.setdefault(roomID, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription.roomID is None:
+                self.all.discard(subscription)
+            else:
+                subscriptions = self.rooms.get(subscription.roomID)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self.rooms[subscription.roomID]
+
+    def stream(self, subscription, initial, keepalive=15):
+        """
+        推送连接的响应体：先发送当前完整状态，之后逐条发送变化，空闲时发送心跳
+        连接断开（生成器被关闭）时自动取消订阅
+        """
+        try:
+            yield initial
+            while not subscription.closed:
+                try:
+                    yield subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+    def publish(self, deltas):
+        """
+        :param deltas: 变化房间的状态列表，每项包含 roomID
+        """
+        if not deltas:
+            return
+        with self.lock:
+            everyone = list(self.all)
+            targets = [(list(self.rooms.get(delta['roomID'], ())), delta) for delta in deltas]
+        if everyone:
+            message = sse_message('rooms', deltas)
+            for subscription in everyone:
+                subscription.put(message)
+        for subscriptions, delta in targets:
+            if not subscriptions:
+                continue
+            message = sse_message('room', delta)
+            for subscription in subscriptions:
+                subscription.put(message)
@@ -0,0 +1,191 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from utils.cache import TTLCache
+
+
+class LogServiceError(Exception):
+    """
+    日志服务不可用：超时、连接失败、5xx、响应不是 JSON，或熔断器打开
+    """
+
+
+class CircuitOpen(LogServiceError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败 failures 次后打开，reset_timeout 秒内的调用直接失败；
+    之后放行一次试探请求（半开），成功则关闭，失败则重新打开
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failures=5, reset_timeout=30., clock=time.monotonic):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failed = 0  # 连续失败次数
+        self.opened_at = 0.
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False  # 打开，或半开时已有试探请求
+
+    def success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failed = 0
+
+    def failure(self):
+        with self.lock:
+            self.failed += 1
+            if self.state == self.HALF_OPEN or self.failed >= self.failures:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+
+class LogClient:
+    """
+    远程日志服务的客户端：
+    - 复用连接（requests.Session + 连接池）
+    - 连接/读取超时，失败时指数退避重试（只重试连接失败、超时和 5xx）
+    - 熔断器：上游持续不可用时立即失败，不再占用请求线程
+    - 成功的响应缓存 cache_ttl 秒
+    - 调用在线程池中执行，call() 最多等待 deadline 秒；也可以 submit() 拿 Future，或在 asyncio 中 await acall()
+        >> client = LogClient('http://127.0.0.1:8000')
+        >> client.call(client.get_all_logs)
+    """
+
+    def __init__(self, base_url, connect_timeout=1., read_timeout=3., retries=2, backoff=0.2, deadline=5.,
+                 cache_ttl=30., pool_size=10, workers=4, breaker=None):
+        self.base_url = base_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff  # 第 n 次重试前等待 backoff * 2 ** n 秒（带随机抖动）
+        self.deadline = deadline
+        self.pool_size = pool_size
+        self.workers = workers
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = TTLCache(maxsize=256, ttl=cache_ttl)
+        self.lock = threading.Lock()
+        self.session = None
+        self.executor = None
+        self.requests = 0
+        self.failures = 0
+
+    def http(self):
+        # 第一次请求时才导入 requests 并创建连接池
+        with self.lock:
+            if self.session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.session = session
+            return self.session
+
+    def pool(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='log-client')
+            return self.executor
+
+    def request(self, method, path, **kwargs):
+        """
+        同步请求，返回解析后的 JSON；失败时抛出 LogServiceError
+        """
+        import requests
+        if not self.breaker.allow():
+            raise CircuitOpen(f'log service circuit is open: {self.base_url}')
+        url = self.base_url.rstrip('/') + '/' + path.lstrip('/')
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1) * (0.5 + random.random()))
+            self.requests += 1
+            try:
+                response = self.http().request(method, url, timeout=(self.connect_timeout, self.read_timeout),
+                                               **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                continue
+            if response.status_code >= 500:
+                error = LogServiceError(f'{method} {url}: {response.status_code}')
+                continue
+            if response.status_code >= 400:  # 请求本身有误，重试没有意义，也不算上游故障
+                self.breaker.success()
+                raise LogServiceError(f'{method} {url}: {response.status_code}')
+            try:
+                data = response.json()
+            except ValueError as e:
+                error = e
+                break
+            self.breaker.success()
+            return data
+        self.failures += 1
+        self.breaker.failure()
+        raise LogServiceError(f'{method} {url} failed: {error}') from error
+
+    def cached(self, key, load):
+        value = self.cache.get(key)
+        if value is None:
+            value = load()
+            self.cache.set(key, value)
+        return value
+
+    def get_ac_info(self, start_time, end_time):
+        # 时间段内各房间的空调使用记录
+        return self.cached(('ac_info', start_time, end_time), lambda: self.request(
+            'POST', '/api/logs/get_ac_info/', data={'start_time': start_time, 'end_time': end_time}))
+
+    def get_all_logs(self):
+        return self.cached(('all_logs',), lambda: self.request('GET', '/api/logs/get_all_logs/'))
+
+    def submit(self, function, *args):
+        # 在线程池中执行，返回 concurrent.futures.Future
+        return self.pool().submit(function, *args)
+
+    def call(self, function, *args, timeout=None):
+        """
+        在线程池中执行并最多等待 timeout（默认 deadline）秒，超时抛出 LogServiceError，
+        请求线程不会被上游拖住（线程池中的请求仍受连接/读取超时限制）
+        """
+        future = self.submit(function, *args)
+        try:
+            return future.result(self.deadline if timeout is None else timeout)
+        except FutureTimeout:
+            raise LogServiceError('log service deadline exceeded') from None
+
+    async def acall(self, function, *args):
+        # asyncio 中使用：await client.acall(client.get_all_logs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(self.submit(function, *args)), self.deadline)
+        except asyncio.TimeoutError:
+            raise LogServiceError('log service deadline exceeded') from None
+
+    def stats(self):
+        return dict(baseUrl=self.base_url, circuit=self.breaker.state, requests=self.requests,
+                    failures=self.failures, cache=self.cache.stats())
+
+    def close(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+            if self.session is not None:
+                self.session.close()
+                self.session = None
@@ -0,0 +1,108 @@
+"""
+本地的日志服务替身，接口与远程日志服务相同，用于开发和测试 utils.log_client：
+    python -m utils.log_stub --port 8000 --delay 0.5 --fail 0.2
+    HOTEL_LOG_SERVICE_URL=http://127.0.0.1:8000 flask --app end run
+也可以在进程内启动：
+    >> stub = LogStubServer(delay=2.).start()
+    >> client = LogClient(stub.url)
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+SAMPLE_LOGS = [
+    dict(roomNumber='房间101', operation='开机', time='2023-11-21 08:00:00', fanSpeed='MEDIUM', fee=0.),
+    dict(roomNumber='房间101', operation='调风', time='2023-11-21 08:10:00', fanSpeed='HIGH', fee=5.),
+    dict(roomNumber='房间102', operation='开机', time='2023-11-21 09:00:00', fanSpeed='LOW', fee=0.),
+    dict(roomNumber='房间101', operation='关机', time='2023-11-21 09:30:00', fanSpeed='HIGH', fee=32.),
+]
+
+
+class LogStubServer:
+    """
+    :param delay: 每个请求的响应延迟（秒），用于测试超时
+    :param fail: 返回 503 的概率，用于测试重试和熔断
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0., fail=0., logs=None):
+        self.delay = delay
+        self.fail = fail
+        self.logs = SAMPLE_LOGS if logs is None else logs
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status, body):
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def handle_request(self, form):
+                stub.requests += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if random.random() < stub.fail:
+                    return self.reply(503, dict(error='unavailable'))
+                if self.path.startswith('/api/logs/get_all_logs'):
+                    return self.reply(200, dict(log=stub.logs))
+                if self.path.startswith('/api/logs/get_ac_info'):
+                    start, end = form.get('start_time', [''])[0], form.get('end_time', ['~'])[0]
+                    return self.reply(200, dict(detail=[log for log in stub.logs if start <= log['time'] <= end]))
+                return self.reply(404, dict(error='not found'))
+
+            def do_GET(self):
+                self.handle_request({})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.handle_request(parse_qs(self.rfile.read(length).decode('utf-8')))
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='log-stub', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--delay', type=float, default=0., help='响应延迟（秒）')
+    parser.add_argument('--fail', type=float, default=0., help='返回 503 的概率')
+    args = parser.parse_args()
+    stub = LogStubServer(args.host, args.port, args.delay, args.fail)
+    print(f'log service stub on {stub.url}')
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+ALGORITHM = 'pbkdf2_sha256'
+
+
+def b64encode(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class PasswordHasher:
+    """
+    PBKDF2-SHA256 密码哈希，存储格式：pbkdf2_sha256$<迭代次数>$<盐>$<哈希>
+    迭代次数（cost）可以配置，修改后旧的哈希在下次登录成功时按新的 cost 重新计算
+    hashlib 计算时释放 GIL，verify 直接在请求线程中调用，多个请求线程可以同时验证
+    批量哈希（hash_many，批量入住）在线程池中并行，线程数限制了同时占用的 CPU 数
+    """
+
+    def __init__(self, iterations=200_000, salt_size=16, workers=None):
+        self.iterations = iterations
+        self.salt_size = salt_size
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+
+    def pool(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hasher')
+        return self.executor
+
+    def derive(self, password, salt, iterations):
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+
+    def hash(self, password, iterations=None):
+        iterations = iterations or self.iterations
+        salt = os.urandom(self.salt_size)
+        return f'{ALGORITHM}${iterations}${b64encode(salt)}${b64encode(self.derive(password, salt, iterations))}'
+
+    def hash_many(self, passwords):
+        # 批量计算（例如批量入住），在线程池中并行，全部按当前 cost
+        return list(self.pool().map(self.hash, passwords))
+
+    def is_hashed(self, stored):
+        return stored.startswith(ALGORITHM + '$')
+
+    def needs_rehash(self, stored):
+        # 明文（旧数据）或 cost 与当前配置不同
+        return not self.is_hashed(stored) or int(stored.split('$')[1]) != self.iterations
+
+    def verify(self, password, stored):
+        if not self.is_hashed(stored):  # 升级前以明文保存的密码
+            return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+        _, iterations, salt, expected = stored.split('$')
+        return hmac.compare_digest(self.derive(password, b64decode(salt), int(iterations)), b64decode(expected))
@@ -0,0 +1,69 @@
+import collections
+import sys
+import threading
+import time
+import traceback
+
+
+class SamplingProfiler:
+    """
+    采样分析器：后台线程每隔 interval 秒记录一次所有线程的调用栈，
+    按调用栈计数，输出 flamegraph.pl / speedscope 可读的折叠格式
+    开启后才有开销，默认关闭
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.lock = threading.Lock()
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.started_at = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+        self.started_at = time.time()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='sampling-profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.running:
+            self.thread.join()
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        with self.lock:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                frames = traceback.extract_stack(frame, limit=self.max_depth)
+                stack = ';'.join(f'{entry.name} ({entry.filename.rsplit("/", 1)[-1]}:{entry.lineno})'
+                                 for entry in frames)
+                self.stacks[f'{names.get(ident, ident)};{stack}'] += 1
+            self.samples += 1
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def folded(self):
+        # 每行：线程;函数;函数... 次数
+        with self.lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def stats(self):
+        return dict(running=self.running, samples=self.samples, stacks=len(self.stacks), startedAt=self.started_at,
+                    interval=self.interval)
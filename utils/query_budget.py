@@ -0,0 +1,105 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# 语句形状：去掉字面量和参数个数的差异，同一处代码在循环中执行的语句形状相同
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PARAMETER_LISTS = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    shape = LITERALS.sub('?', statement)
+    shape = PARAMETER_LISTS.sub('(?...)', shape)
+    return WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    SQL 语句数超过声明的预算，或同一形状的语句重复执行（N+1）
+    """
+
+
+class QueryLog:
+    """
+    一个请求（或一段代码）中执行的 SQL：条数、总耗时、每种语句形状的次数
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        # 执行次数不少于 threshold 的语句形状，通常是在循环中按行懒加载关系
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def problems(self, budget=None, repeat_threshold=None):
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(f'{self.count} queries exceed the budget of {budget}')
+        if repeat_threshold is not None:
+            problems += [f'{count}x {shape[:200]}' for shape, count in self.repeated(repeat_threshold)]
+        return problems
+
+
+def timed(engine, record, key):
+    """
+    在 engine 上注册一对 before/after_cursor_execute 监听，每条语句执行后调用 record(statement, 耗时)
+    key: 连接上保存开始时间的栈（conn.info[key]），每个监听使用自己的 key，互不干扰
+    :return: 取消监听的函数
+    """
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(key, []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        record(statement, time.perf_counter() - conn.info[key].pop())
+
+    event.listen(engine, 'before_cursor_execute', before)
+    event.listen(engine, 'after_cursor_execute', after)
+
+    def remove():
+        event.remove(engine, 'after_cursor_execute', after)
+        event.remove(engine, 'before_cursor_execute', before)
+
+    return remove
+
+
+def query_budget(max_queries):
+    """
+    声明视图函数最多执行的 SQL 语句数，超出时记录警告，严格模式（调试、测试）下使请求失败
+        >> @api.route('/rooms')
+        >> @query_budget(3)
+        >> def rooms_status(): ...
+    """
+    def decorate(view):
+        view.query_budget = max_queries
+        return view
+
+    return decorate
+
+
+@contextmanager
+def assert_max_queries(engine, max_queries, repeat_threshold=None):
+    """
+    测试中使用：代码块内在 engine 上执行的语句超过 max_queries 条，或有语句形状重复 repeat_threshold 次以上时失败
+        >> with assert_max_queries(db.engine, 2):
+        >>     client.get('/rooms')
+    """
+    log = QueryLog()
+    remove = timed(engine, log.record, key='assert_max_queries')
+    try:
+        yield log
+    finally:
+        remove()
+    problems = log.problems(max_queries, repeat_threshold)
+    if problems:
+        raise QueryBudgetExceeded('; '.join(problems))
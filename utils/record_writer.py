@@ -0,0 +1,91 @@
+import queue
+import threading
+import time
+import traceback
+
+
+class BatchWriter:
+    """
+    后台批量写入：调用方把行放入有界队列后立即返回，后台线程把队列中的行按批交给 sink 写入
+    sink(rows) 接收一个字典列表，应在一个事务中完成批量插入（executemany）
+    """
+
+    def __init__(self, sink, maxsize=10000, batch_size=500, interval=1., retries=3, name='batch-writer'):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval  # 队列为空时最长等待时间（秒）
+        self.retries = retries  # 写入失败时的重试次数
+        self.name = name
+        self.queue = queue.Queue(maxsize)
+        self.stopped = threading.Event()
+        self.thread = None
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        # 每次启动创建新的线程，stop() 之后可以再次 start()
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def submit(self, row):
+        # 不阻塞；队列已满时返回 False，由调用方稍后重试
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except queue.Full:
+            return False
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def stop(self, timeout=None):
+        # 停止后台线程，并写完队列中剩余的行
+        self.stopped.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout)
+        self.drain()
+
+    def stats(self):
+        return dict(pending=self.pending(), written=self.written, failed=self.failed, batches=self.batches)
+
+    def take(self, timeout):
+        # 取出一批行，最多 batch_size 条
+        try:
+            batch = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def write(self, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                self.sink(batch)
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except Exception:
+                traceback.print_exc()
+                time.sleep(min(0.1 * 2 ** attempt, 2.))
+        self.failed += len(batch)
+
+    def drain(self):
+        while True:
+            batch = self.take(timeout=0)
+            if not batch:
+                return
+            self.write(batch)
+
+    def run(self):
+        while not self.stopped.is_set():
+            batch = self.take(self.interval)
+            if batch:
+                self.write(batch)
@@ -0,0 +1,66 @@
+from datetime import date, datetime, timedelta
+
+# 报表周期：按天、按周（周一开始）、按月
+PERIODS = ('daily', 'weekly', 'monthly')
+
+# 汇总的指标：开机次数、服务时长（秒）、调度次数、能耗（温度改变量）、费用
+METRICS = ('turnOns', 'servedSeconds', 'dispatches', 'energy', 'fees')
+
+
+def period_range(period, day: date):
+    """
+    day 所在的报表周期 [start, end)
+    """
+    if period == 'daily':
+        start = day
+        return start, start + timedelta(days=1)
+    if period == 'weekly':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    if period == 'monthly':
+        start = day.replace(day=1)
+        return start, (start + timedelta(days=32)).replace(day=1)
+    raise ValueError(f'unknown period {period}')
+
+
+def usage_deltas(records):
+    """
+    把一批详单合并为 (日期, 房间, 风速) 汇总行的增量，每个键只需更新一行
+    每条详单是一次调度（一段服务），turnedOn 为真时是开机后的第一段服务；整段记在服务开始的那一天
+    :return: {(day, roomID, fanSpeed): [turnOns, servedSeconds, dispatches, energy, fees]}
+    """
+    deltas = {}
+    for record in records:
+        start = record['serveStartTime']
+        key = (datetime(start.year, start.month, start.day), record['roomID'], record['fanSpeed'])
+        delta = deltas.setdefault(key, [0, 0., 0, 0., 0.])
+        delta[0] += 1 if record.get('turnedOn') else 0
+        delta[1] += (record['serveEndTime'] - start).total_seconds()
+        delta[2] += 1
+        delta[3] += record['energy']
+        delta[4] += record['consumption']
+    return deltas
+
+
+def summarize_usage(rollups):
+    """
+    汇总行 -> 报表：合计、按房间、按风速、按天
+    rollups 的元素需要有 day, roomID, fanSpeed 和 METRICS 中的属性
+    """
+    def empty():
+        return dict.fromkeys(METRICS, 0)
+
+    def add(target, rollup):
+        for name in METRICS:
+            target[name] += getattr(rollup, name)
+
+    total, rooms, speeds, days = empty(), {}, {}, {}
+    for rollup in rollups:
+        add(total, rollup)
+        add(rooms.setdefault(rollup.roomID, empty()), rollup)
+        add(speeds.setdefault(rollup.fanSpeed, empty()), rollup)
+        add(days.setdefault(rollup.day.date().isoformat(), empty()), rollup)
+    total['servedMinutes'] = total['servedSeconds'] / 60
+    return dict(total=total,
+                rooms=[dict(roomID=roomID, **values) for roomID, values in sorted(rooms.items())],
+                fanSpeeds=speeds, days=days)
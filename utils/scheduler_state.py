@@ -0,0 +1,298 @@
+import numpy as np
+
+from utils.enums import FanSpeed, QueueState
+
+# 调度器独占的列，只由调度器写回数据库
+SCHEDULER_COLUMNS = ('roomTemperature', 'queueState', 'consumption', 'firstRuntime')
+
+# 队列状态在数组中的编码
+QUEUE_CODES = {QueueState.IDLE: 0, QueueState.PENDING: 1, QueueState.RUNNING: 2}
+QUEUE_STATES = {code: state for state, code in QUEUE_CODES.items()}
+RUNNING = QUEUE_CODES[QueueState.RUNNING]
+
+# 风速在数组中的编码，用于按风速查费率
+FAN_SPEEDS = list(FanSpeed)
+FAN_CODES = {speed: code for code, speed in enumerate(FAN_SPEEDS)}
+
+
+class RoomView:
+    """
+    单个房间在列式状态中的视图，读写直接落到对应的数组槽位上
+    """
+    __slots__ = ('table', 'slot', 'roomID')
+
+    def __init__(self, table, slot, roomID):
+        self.table = table
+        self.slot = slot
+        self.roomID = roomID
+
+    @property
+    def roomTemperature(self):
+        return float(self.table.roomTemperature[self.slot])
+
+    @roomTemperature.setter
+    def roomTemperature(self, value):
+        self.table.roomTemperature[self.slot] = value
+        self.table.touch(self.slot)
+
+    @property
+    def acTemperature(self):
+        return float(self.table.acTemperature[self.slot])
+
+    @property
+    def initialTemperature(self):
+        return float(self.table.initialTemperature[self.slot])
+
+    @property
+    def fanSpeed(self):
+        return self.table.fanSpeed[self.slot]
+
+    @property
+    def acMode(self):
+        return self.table.acMode[self.slot]
+
+    @property
+    def customerSessionID(self):
+        return self.table.customerSessionID[self.slot]
+
+    @property
+    def queueState(self):
+        return QUEUE_STATES[int(self.table.queue[self.slot])]
+
+    @queueState.setter
+    def queueState(self, value):
+        self.table.queue[self.slot] = QUEUE_CODES[value]
+        self.table.touch(self.slot)
+
+    @property
+    def consumption(self):
+        return float(self.table.consumption[self.slot])
+
+    @consumption.setter
+    def consumption(self, value):
+        self.table.consumption[self.slot] = value
+        self.table.touch(self.slot)
+
+    @property
+    def energy(self):
+        return float(self.table.energy[self.slot])
+
+    @property
+    def firstRuntime(self):
+        return self.table.firstRuntime[self.slot]
+
+    @firstRuntime.setter
+    def firstRuntime(self, value):
+        self.table.firstRuntime[self.slot] = value
+        self.table.touch(self.slot)
+
+    def to_mapping(self):
+        # 批量写回时使用的字典（主键 + 调度器独占的列）
+        mapping = {name: getattr(self, name) for name in SCHEDULER_COLUMNS}
+        mapping['roomID'] = self.roomID
+        return mapping
+
+
+class SchedulerState:
+    """
+    调度器持有的全部房间状态，按列存放在 NumPy 数组中，每次调度对所有房间做一次批量计算
+    speed: 风速 -> 每分钟温度改变速率（与 ACScheduler.get_speed 一致）
+    slots: roomID -> 数组下标
+    dirty: 自上次写回后被修改过的槽位
+    changed: 自上次推送后被修改过的槽位
+    energy: 累计的温度改变量（能耗），只在内存中，详单按时间段的差值记账，不从费用和费率反推
+    """
+
+    def __init__(self, speed, capacity=64):
+        self.speed_of = speed
+        self.slots = {}
+        self.free = []
+        self.size = 0
+        self.loaded = False
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        self.roomID = np.zeros(capacity, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.dirty = np.zeros(capacity, dtype=bool)
+        self.changed = np.zeros(capacity, dtype=bool)
+        self.roomTemperature = np.zeros(capacity)
+        self.acTemperature = np.zeros(capacity)
+        self.initialTemperature = np.zeros(capacity)
+        self.speed = np.zeros(capacity)
+        self.fanCode = np.zeros(capacity, dtype=np.int8)
+        self.queue = np.zeros(capacity, dtype=np.int8)
+        self.consumption = np.zeros(capacity)
+        self.energy = np.zeros(capacity)
+        self.fanSpeed = [None] * capacity
+        self.acMode = [None] * capacity
+        self.customerSessionID = [None] * capacity
+        self.firstRuntime = [None] * capacity
+
+    def grow(self):
+        capacity = len(self.active) * 2
+        for name in ('roomID', 'active', 'dirty', 'changed', 'roomTemperature', 'acTemperature', 'initialTemperature',
+                     'speed', 'fanCode', 'queue', 'consumption', 'energy'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        for name in ('fanSpeed', 'acMode', 'customerSessionID', 'firstRuntime'):
+            column = getattr(self, name)
+            column.extend([None] * (capacity - len(column)))
+
+    def __contains__(self, roomID):
+        return roomID in self.slots
+
+    def __len__(self):
+        return len(self.slots)
+
+    def get(self, roomID):
+        slot = self.slots.get(roomID)
+        return None if slot is None else RoomView(self, slot, roomID)
+
+    def views(self):
+        return [RoomView(self, slot, roomID) for roomID, slot in self.slots.items()]
+
+    def load(self, rooms):
+        # 从数据库行初始化全部状态
+        self.slots = {}
+        self.free = []
+        self.size = 0
+        self.allocate(max(64, len(rooms)))
+        for room in rooms:
+            self.upsert(room)
+        self.dirty[:] = False
+        self.changed[:] = False
+        self.loaded = True
+
+    def new_slot(self, roomID):
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.size == len(self.active):
+                self.grow()
+            slot = self.size
+            self.size += 1
+        self.slots[roomID] = slot
+        self.roomID[slot] = roomID
+        self.active[slot] = True
+        return slot
+
+    def write_row(self, slot, room):
+        # 用数据库行覆盖槽位中的全部列
+        self.roomTemperature[slot] = room.roomTemperature
+        self.queue[slot] = QUEUE_CODES[room.queueState]
+        self.consumption[slot] = room.consumption if room.consumption is not None else 0.0
+        self.firstRuntime[slot] = room.firstRuntime
+        self.write_config(slot, room)
+
+    def write_config(self, slot, room):
+        self.acTemperature[slot] = room.acTemperature
+        self.initialTemperature[slot] = room.initialTemperature
+        self.fanSpeed[slot] = room.fanSpeed
+        self.acMode[slot] = room.acMode
+        self.customerSessionID[slot] = room.customerSessionID
+        self.speed[slot] = self.speed_of(room.fanSpeed)
+        self.fanCode[slot] = FAN_CODES[room.fanSpeed]
+
+    def upsert(self, room):
+        """
+        新增房间，或同步房间的配置列（目标温度、风速、模式、初始温度、入住会话）
+        调度器独占的列以内存为准，不被覆盖
+        """
+        slot = self.slots.get(room.roomID)
+        if slot is None:
+            slot = self.new_slot(room.roomID)
+            self.write_row(slot, room)
+        else:
+            self.write_config(slot, room)
+        return RoomView(self, slot, room.roomID)
+
+    def reset(self, room):
+        """
+        入住、退房时重置房间：调度器独占的列直接置为初始值（关机、费用清零），只从数据库行同步配置列，室温仍以内存为准
+        行中的调度器列可能已被提交之后的一次写回覆盖为旧状态，不能读取
+        """
+        slot = self.slots.get(room.roomID)
+        if slot is None:
+            slot = self.new_slot(room.roomID)
+            self.roomTemperature[slot] = room.roomTemperature
+        self.queue[slot] = QUEUE_CODES[QueueState.IDLE]
+        self.consumption[slot] = 0.0
+        self.energy[slot] = 0.0
+        self.firstRuntime[slot] = None
+        self.write_config(slot, room)
+        self.touch(slot)
+        return RoomView(self, slot, room.roomID)
+
+    def remove(self, roomID):
+        slot = self.slots.pop(roomID, None)
+        if slot is None:
+            return
+        self.active[slot] = False
+        self.dirty[slot] = False
+        self.changed[slot] = False
+        self.queue[slot] = 0
+        for column in (self.fanSpeed, self.acMode, self.customerSessionID, self.firstRuntime):
+            column[slot] = None
+        self.free.append(slot)
+
+    def touch(self, slot):
+        self.dirty[slot] = True
+        self.changed[slot] = True
+
+    def mark_dirty(self, roomID):
+        self.touch(self.slots[roomID])
+
+    def heat(self, dt, boost, rates):
+        """
+        所有 RUNNING 房间向目标温度制冷/制热一步，累计能耗，并按各自风速的费率累计费用
+        :param rates: {FanSpeed: 费率}
+        :return: 本次达到目标温度的房间ID（需要回到等待队列）
+        """
+        n = self.size
+        temperature, target = self.roomTemperature[:n], self.acTemperature[:n]
+        running = self.active[:n] & (self.queue[:n] == RUNNING)
+        step = self.speed[:n] * dt / 60 * boost
+        diff = target - temperature
+        need = np.abs(diff)
+        # 与逐个房间计算时的判定一致：差值严格小于本次可改变的温度，或已经等于目标温度
+        reached = running & ((need < step) | (diff == 0))
+        moving = running & (diff != 0)
+        delta = np.minimum(need[moving], step[moving])
+        temperature[moving] += np.where(diff[moving] > 0, delta, -delta)
+        price = np.array([rates[speed] for speed in FAN_SPEEDS])[self.fanCode[:n][moving]]
+        self.consumption[:n][moving] += delta * price
+        self.energy[:n][moving] += delta
+        self.dirty[:n] |= running
+        self.changed[:n] |= running
+        return self.roomID[:n][reached].tolist()
+
+    def drift(self, dt, boost, cooling_rate):
+        # 所有未运行的房间向初始温度回温一步
+        n = self.size
+        temperature, initial = self.roomTemperature[:n], self.initialTemperature[:n]
+        change = cooling_rate * dt * boost
+        idle = self.active[:n] & (self.queue[:n] != RUNNING) & (temperature != initial)
+        hot = idle & (temperature > initial)
+        cold = idle & (temperature < initial)
+        temperature[hot] = np.maximum(temperature[hot] - change, initial[hot])
+        temperature[cold] = np.minimum(temperature[cold] + change, initial[cold])
+        self.dirty[:n] |= idle
+        self.changed[:n] |= idle
+
+    def pop_dirty(self):
+        # 取出需要写回的行，并清空脏标记
+        n = self.size
+        slots = np.flatnonzero(self.dirty[:n] & self.active[:n])
+        mappings = [RoomView(self, slot, int(self.roomID[slot])).to_mapping() for slot in slots]
+        self.dirty[:] = False
+        return mappings
+
+    def pop_changes(self):
+        # 取出自上次推送后变化的房间，并清空变化标记
+        n = self.size
+        slots = np.flatnonzero(self.changed[:n] & self.active[:n])
+        self.changed[:] = False
+        return [RoomView(self, slot, int(self.roomID[slot])) for slot in slots]
@@ -0,0 +1,151 @@
+import json
+import statistics
+import time
+
+from utils.enums import FanSpeed, QueueState
+
+# 轨迹中的事件：在仿真开始后 t 秒对房间执行 command
+#   turn_on / turn_off
+#   fan_speed    value 为 FanSpeed 名称（LOW / MEDIUM / HIGH）
+#   temperature  value 为目标温度
+EVENTS = ('turn_on', 'turn_off', 'fan_speed', 'temperature')
+
+
+class TraceEvent:
+    __slots__ = ('t', 'roomID', 'command', 'value')
+
+    def __init__(self, t, roomID, command, value=None):
+        assert command in EVENTS, f'unknown event {command}'
+        self.t = t
+        self.roomID = roomID
+        self.command = command
+        self.value = value
+
+    def to_dict(self):
+        return dict(t=self.t, roomID=self.roomID, command=self.command, value=self.value)
+
+
+def load_trace(path):
+    # 每行一个 JSON 事件
+    with open(path, encoding='utf-8') as file:
+        return [TraceEvent(**json.loads(line)) for line in file if line.strip()]
+
+
+def dump_trace(trace, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        for event in trace:
+            file.write(json.dumps(event.to_dict()) + '\n')
+
+
+def generate_trace(roomIDs, seconds, rng, mean_off=3600., mean_on=1800., fan_change=0.3):
+    """
+    随机生成轨迹：每个房间交替关机（平均 mean_off 秒）和开机（平均 mean_on 秒），
+    开机期间以 fan_change 的概率调整一次风速；相同的 rng 种子生成相同的轨迹
+    """
+    trace = []
+    speeds = list(FanSpeed)
+    for roomID in roomIDs:
+        t = rng.expovariate(1 / mean_off)
+        while t < seconds:
+            trace.append(TraceEvent(t, roomID, 'turn_on'))
+            on = rng.expovariate(1 / mean_on)
+            if rng.random() < fan_change:
+                trace.append(TraceEvent(t + rng.random() * on, roomID, 'fan_speed', rng.choice(speeds).name))
+            t += on
+            if t < seconds:
+                trace.append(TraceEvent(t, roomID, 'turn_off'))
+            t += rng.expovariate(1 / mean_off)
+    trace.sort(key=lambda event: (event.t, event.roomID))
+    return trace
+
+
+def summarize(samples):
+    if not samples:
+        return dict(count=0, mean=None, p50=None, p90=None, p99=None, max=None)
+    samples = sorted(samples)
+
+    def at(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    return dict(count=len(samples), mean=statistics.fmean(samples), p50=at(0.5), p90=at(0.9), p99=at(0.99),
+                max=samples[-1])
+
+
+class Simulation:
+    """
+    离散事件仿真：按轨迹向调度器提交命令，仿真时钟每次前进 tick 秒后调用一次 update，
+    不等待真实时间，CPU 允许多快就跑多快
+    scheduler 应使用 MemoryStorage 和 SimulatedClock，rooms 为存储中的房间（roomID -> 房间）
+    """
+
+    def __init__(self, scheduler, clock, rooms, trace, tick=1.):
+        self.scheduler = scheduler
+        self.clock = clock
+        self.rooms = rooms
+        self.trace = trace
+        self.tick = tick
+        self.requests = 0
+        self.ticks = 0
+        self.running_samples = 0
+
+    def apply(self, event):
+        room = self.rooms[event.roomID]
+        if event.command == 'fan_speed':
+            room.fanSpeed = FanSpeed[event.value]
+            command = 'sync'
+        elif event.command == 'temperature':
+            room.acTemperature = event.value
+            command = 'sync'
+        else:
+            command = event.command
+            self.requests += command == 'turn_on'
+        self.submit(command, event.roomID)
+
+    def submit(self, command, roomID):
+        # 命令队列已满时先在当前时刻执行一次调度（不推进时钟）
+        while self.scheduler.inbox.submit(command, roomID) is None:
+            self.scheduler.update()
+
+    def step(self):
+        self.clock.advance(self.tick)
+        self.scheduler.update()
+        self.scheduler.records.drain()
+        self.ticks += 1
+        self.running_samples += len(self.scheduler.running_list)
+
+    def run(self, seconds=None):
+        """
+        :param seconds: 仿真时长，默认到轨迹中最后一个事件
+        :return: 仿真报告
+        """
+        seconds = seconds if seconds is not None else (self.trace[-1].t if self.trace else 0.)
+        start = time.perf_counter()
+        index = 0
+        while self.clock.elapsed < seconds:
+            while index < len(self.trace) and self.trace[index].t <= self.clock.elapsed:
+                self.apply(self.trace[index])
+                index += 1
+            self.step()
+        # 结束时关闭所有空调，使正在服务的时间段也产生详单
+        for roomID, room in self.rooms.items():
+            state = self.scheduler.state.get(roomID)
+            if state is not None and state.queueState != QueueState.IDLE:
+                self.submit('turn_off', roomID)
+        self.scheduler.update()
+        self.scheduler.records.drain()
+        return self.report(seconds, time.perf_counter() - start)
+
+    def report(self, seconds, wall):
+        records = self.scheduler.storage.records
+        waits = [(record.serveStartTime - record.requestTime).total_seconds() for record in records]
+        served = [(record.serveEndTime - record.serveStartTime).total_seconds() for record in records]
+        hours = seconds / 3600 or 1.
+        return dict(
+            simulatedSeconds=seconds, wallSeconds=wall, speedup=seconds / wall if wall else None,
+            ticks=self.ticks, ticksPerSecond=self.ticks / wall if wall else None,
+            maxNum=self.scheduler.max_num, timeSlice=self.scheduler.time_slice.total_seconds(),
+            requests=self.requests, segments=len(records), segmentsPerHour=len(records) / hours,
+            utilization=self.running_samples / self.ticks / self.scheduler.max_num if self.ticks else 0.,
+            waitSeconds=summarize(waits), serveSeconds=summarize(served),
+            energy=sum(usage.energy for usage in self.scheduler.storage.usage_rollups.values()),
+            fees=sum(record.consumption for record in records))
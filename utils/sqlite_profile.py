@@ -0,0 +1,55 @@
+from sqlalchemy import event
+
+# 每个连接建立时执行的 PRAGMA，按配置 SQLITE_PROFILE 选择
+PROFILES = {
+    # SQLite 默认设置（回滚日志，写事务期间阻塞读）
+    'default': {},
+    # WAL：读不阻塞写、写不阻塞读；synchronous=NORMAL 在 WAL 下只在检查点时 fsync，掉电可能丢失最后几个事务
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,  # 毫秒，等待其他连接释放写锁
+        'cache_size': -16000,  # 负数表示 KiB，即每个连接 16 MB 页缓存
+        'mmap_size': 128 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+    # WAL + 每次提交 fsync
+    'wal-durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+        'cache_size': -16000,
+        'mmap_size': 128 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+}
+
+
+def is_sqlite(uri):
+    return uri.startswith('sqlite')
+
+
+def engine_options(profile, pool_size=10, max_overflow=20):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS：文件数据库使用连接池，允许多个读连接同时进行
+    """
+    pragmas = PROFILES[profile]
+    options = dict(pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=False,
+                   connect_args={'check_same_thread': False})
+    if 'busy_timeout' in pragmas:
+        options['connect_args']['timeout'] = pragmas['busy_timeout'] / 1000
+    return options
+
+
+def install_pragmas(engine, profile):
+    # 在每个新建的连接上执行 profile 中的 PRAGMA
+    pragmas = PROFILES[profile]
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(connection, _):
+        cursor = connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
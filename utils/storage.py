@@ -0,0 +1,245 @@
+import bisect
+import contextlib
+import itertools
+import threading
+import time
+
+from utils.billing import aggregate, ledger_entries, speed_rates
+from utils.enums import AcMode, FanSpeed, QueueState
+from utils.reports import METRICS, usage_deltas
+
+
+class MemoryRoom:
+    """
+    内存中的房间，字段与 end.Room 一致
+    """
+
+    def __init__(self, roomID, roomName=None, roomDescription='', unitPrice=0., acTemperature=25,
+                 fanSpeed=FanSpeed.MEDIUM, acMode=AcMode.COOL, initialTemperature=25., customerSessionID=None,
+                 checkInTime=None):
+        self.roomID = roomID
+        self.roomName = str(roomID) if roomName is None else roomName
+        self.roomDescription = roomDescription
+        self.unitPrice = unitPrice
+        self.acTemperature = acTemperature
+        self.fanSpeed = fanSpeed
+        self.acMode = acMode
+        self.initialTemperature = initialTemperature
+        self.roomTemperature = initialTemperature
+        self.queueState = QueueState.IDLE
+        self.consumption = 0.0
+        self.firstRuntime = None
+        self.customerSessionID = customerSessionID
+        self.checkInTime = checkInTime
+
+
+class MemoryRecord:
+    """
+    内存中的详单，字段与 end.RoomRecord 一致
+    """
+    __slots__ = ('id', 'roomID', 'customSessionID', 'requestTime', 'serveStartTime', 'serveEndTime', 'fanSpeed',
+                 'acMode', 'rate', 'consumption', 'accumulatedConsumption')
+
+    def __init__(self, id, **fields):
+        self.id = id
+        for name in self.__slots__[1:]:
+            setattr(self, name, fields.get(name))
+
+
+class MemoryTotal:
+    """
+    内存中的会话累计费用，字段与 end.BillingTotal 一致
+    """
+
+    def __init__(self, customerSessionID, roomID):
+        self.customerSessionID = customerSessionID
+        self.roomID = roomID
+        self.energy = 0.
+        self.amount = 0.
+        self.entries = 0
+        self.updateTime = None
+
+
+class MemoryRollup:
+    """
+    内存中的小时/天汇总，字段与 end.BillingRollup 一致
+    """
+
+    def __init__(self, granularity, periodStart, roomID):
+        self.granularity = granularity
+        self.periodStart = periodStart
+        self.roomID = roomID
+        self.energy = 0.
+        self.amount = 0.
+        self.entries = 0
+
+
+class MemoryUsage:
+    """
+    内存中的报表汇总行，字段与 end.UsageRollup 一致
+    """
+
+    def __init__(self, day, roomID, fanSpeed):
+        self.day = day
+        self.roomID = roomID
+        self.fanSpeed = fanSpeed
+        for name in METRICS:
+            setattr(self, name, 0)
+
+
+class MemorySettings:
+    """
+    内存中的空调设置，字段与 end.SettingSnapshot 一致
+    """
+
+    def __init__(self, rate=1., defaultFanSpeed=FanSpeed.MEDIUM, defaultTemperature=25, minTemperature=16,
+                 maxTemperature=30, acMode=AcMode.COOL, rates=None):
+        self.settingID = 1
+        self.createTime = None
+        self.rate = rate
+        self.rates = speed_rates(rate, rates)
+        self.defaultFanSpeed = defaultFanSpeed
+        self.defaultTemperature = defaultTemperature
+        self.minTemperature = minTemperature
+        self.maxTemperature = maxTemperature
+        self.acMode = acMode
+
+
+class MemoryStorage:
+    """
+    调度器存储接口的内存实现，与 end.SqlStorage 的方法一一对应，不访问磁盘
+    用于调度仿真、压力测试（上万个房间）
+        >> storage = MemoryStorage()
+        >> storage.add_rooms(10000)
+        >> scheduler = ACScheduler(storage)
+    """
+
+    def __init__(self, settings=None):
+        self.lock = threading.Lock()
+        self.rooms = {}  # roomID -> MemoryRoom
+        self.records = []  # 按 id（插入顺序）排列
+        self.entries = []  # 账目
+        self.totals = {}  # customerSessionID -> MemoryTotal
+        self.rollups = {}  # (granularity, periodStart, roomID) -> MemoryRollup
+        self.usage_rollups = {}  # (day, roomID, fanSpeed) -> MemoryUsage
+        self.commands = []  # [(id, command, roomID)]
+        self.lease = None  # (name, holder, 到期时间 time.monotonic)
+        self.settings = settings or MemorySettings()
+        self.room_ids = itertools.count(1)
+        self.record_ids = itertools.count(1)
+        self.command_ids = itertools.count(1)
+
+    def bind(self, app):
+        pass
+
+    def context(self):
+        return contextlib.nullcontext()
+
+    def rollback(self):
+        pass
+
+    def add_room(self, **fields):
+        room = MemoryRoom(next(self.room_ids), **fields)
+        self.rooms[room.roomID] = room
+        return room
+
+    def add_rooms(self, n, **fields):
+        return [self.add_room(**fields) for _ in range(n)]
+
+    def load_rooms(self):
+        return list(self.rooms.values())
+
+    def get_rooms(self, roomIDs):
+        return {roomID: self.rooms[roomID] for roomID in roomIDs if roomID in self.rooms}
+
+    def room_states(self):
+        return list(self.rooms.values())
+
+    def save_rooms(self, mappings):
+        for mapping in mappings:
+            room = self.rooms.get(mapping['roomID'])
+            if room is not None:
+                for name, value in mapping.items():
+                    setattr(room, name, value)
+
+    def latest_settings(self):
+        return self.settings
+
+    def insert_records(self, records):
+        with self.lock:
+            self.records.extend(MemoryRecord(next(self.record_ids), **record) for record in records)
+            entries = ledger_entries(records)
+            self.entries.extend(entries)
+            totals, rollups = aggregate(entries)
+            for sessionID, (roomID, energy, amount, count) in totals.items():
+                total = self.totals.setdefault(sessionID, MemoryTotal(sessionID, roomID))
+                total.energy += energy
+                total.amount += amount
+                total.entries += count
+            for key, (energy, amount, count) in rollups.items():
+                rollup = self.rollups.setdefault(key, MemoryRollup(*key))
+                rollup.energy += energy
+                rollup.amount += amount
+                rollup.entries += count
+            for key, delta in usage_deltas(records).items():
+                usage = self.usage_rollups.setdefault(key, MemoryUsage(*key))
+                for name, value in zip(METRICS, delta):
+                    setattr(usage, name, getattr(usage, name) + value)
+
+    def billing_total(self, sessionID):
+        return self.totals.get(sessionID)
+
+    def billing_totals(self, sessionIDs):
+        return {sessionID: self.totals[sessionID] for sessionID in sessionIDs if sessionID in self.totals}
+
+    def revenue(self, granularity, start=None, end=None, roomID=None):
+        with self.lock:
+            rollups = [rollup for rollup in self.rollups.values() if rollup.granularity == granularity
+                       and (start is None or rollup.periodStart >= start) and (end is None or rollup.periodStart < end)
+                       and (roomID is None or rollup.roomID == roomID)]
+        return sorted(rollups, key=lambda rollup: (rollup.periodStart, rollup.roomID))
+
+    def usage(self, start, end, roomID=None):
+        with self.lock:
+            return [usage for usage in self.usage_rollups.values() if start <= usage.day < end
+                    and (roomID is None or usage.roomID == roomID)]
+
+    def query_records(self, roomID=None, sessionID=None, start=None, end=None, after=None, limit=100):
+        # 与 SqlStorage.query_records 相同的过滤和 (serveStartTime, id) 排序
+        with self.lock:
+            records = [record for record in self.records
+                       if (record.customSessionID == sessionID if sessionID is not None else record.roomID == roomID)
+                       and (start is None or record.serveStartTime >= start)
+                       and (end is None or record.serveStartTime < end)]
+        records.sort(key=lambda record: (record.serveStartTime, record.id))
+        if after is not None:
+            records = records[bisect.bisect_right([(r.serveStartTime, r.id) for r in records], after):]
+        return records[:limit]
+
+    def session_records(self, sessionID, batch_size=500):
+        return self.query_records(sessionID=sessionID, limit=len(self.records))
+
+    def push_commands(self, commands):
+        with self.lock:
+            self.commands.extend((next(self.command_ids), command, roomID) for roomID, command in commands)
+
+    def take_commands(self, limit):
+        with self.lock:
+            return self.commands[:limit]
+
+    def delete_commands(self, last_id):
+        with self.lock:
+            self.commands = [command for command in self.commands if command[0] > last_id]
+
+    def acquire_lease(self, name, holder, ttl):
+        with self.lock:
+            now = time.monotonic()
+            if self.lease is None or self.lease[1] == holder or self.lease[2] < now:
+                self.lease = (name, holder, now + ttl)
+                return True
+            return False
+
+    def release_lease(self, name, holder):
+        with self.lock:
+            if self.lease is not None and self.lease[1] == holder:
+                self.lease = None
@@ -0,0 +1,95 @@
+import threading
+import time
+import traceback
+
+# 错过调度时刻时的处理策略
+SKIP = 'skip'  # 跳过错过的调度，对齐到下一个调度时刻
+CATCH_UP = 'catch_up'  # 立即补跑错过的调度（最多 max_catch_up 次）
+
+
+class TickStats:
+    """
+    调度循环的运行指标（时间单位：秒）
+    """
+
+    def __init__(self):
+        self.ticks = 0
+        self.overruns = 0  # 落后于调度时刻的次数
+        self.skipped = 0  # 被跳过的调度次数
+        self.errors = 0
+        self.last_duration = 0.
+        self.max_duration = 0.
+        self.total_duration = 0.
+        self.last_lag = 0.  # 实际开始时间与计划开始时间之差
+        self.max_lag = 0.
+
+    def record(self, duration, lag):
+        self.ticks += 1
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        self.total_duration += duration
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def as_dict(self):
+        return dict(ticks=self.ticks, overruns=self.overruns, skipped=self.skipped, errors=self.errors,
+                    lastDuration=self.last_duration, maxDuration=self.max_duration,
+                    meanDuration=self.total_duration / self.ticks if self.ticks else 0.,
+                    lastLag=self.last_lag, maxLag=self.max_lag)
+
+
+class FixedRateLoop:
+    """
+    在单个常驻线程中按固定频率调用 callback
+    调度时刻按 start + k * interval 计算，不会因为 callback 的耗时而漂移
+    """
+
+    def __init__(self, interval, callback, policy=SKIP, max_catch_up=5, name='fixed-rate-loop'):
+        assert policy in (SKIP, CATCH_UP), f'unknown policy {policy}'
+        self.interval = interval
+        self.callback = callback
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.stats = TickStats()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def join(self, timeout=None):
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def run(self):
+        next_tick = time.monotonic() + self.interval
+        catch_up = 0
+        while not self.stopped.wait(max(0., next_tick - time.monotonic())):
+            start = time.monotonic()
+            try:
+                self.callback()
+            except Exception:
+                self.stats.errors += 1
+                traceback.print_exc()
+            self.stats.record(time.monotonic() - start, start - next_tick)
+
+            next_tick += self.interval
+            now = time.monotonic()
+            if now <= next_tick:
+                catch_up = 0
+                continue
+            # 已经落后于下一个调度时刻
+            self.stats.overruns += 1
+            missed = int((now - next_tick) // self.interval) + 1
+            if self.policy == CATCH_UP and catch_up < self.max_catch_up:
+                catch_up += 1
+            else:
+                next_tick += missed * self.interval
+                self.stats.skipped += missed
+                catch_up = 0
@@ -0,0 +1,116 @@
+import itertools
+
+
+class IndexedPriorityQueue:
+    """
+    以 roomID 为键的索引优先队列（二叉小顶堆 + 位置表）
+    push / pop / remove / update 为 O(log n)，成员判断为 O(1)
+    优先级相同时按入队先后（FIFO）出队
+    """
+
+    def __init__(self):
+        self.heap = []  # [priority, sequence, key]
+        self.position = {}  # key -> 在堆中的下标
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __bool__(self):
+        return bool(self.heap)
+
+    def __contains__(self, key):
+        return key in self.position
+
+    def __iter__(self):
+        # 按堆中顺序遍历键（不保证出队顺序）
+        return (entry[2] for entry in self.heap)
+
+    def __repr__(self):
+        return f'IndexedPriorityQueue({[tuple(entry) for entry in sorted(self.heap)]})'
+
+    def priority(self, key):
+        return self.heap[self.position[key]][0]
+
+    def push(self, key, priority):
+        # 入队；已在队列中时只修改优先级
+        if key in self.position:
+            self.update(key, priority)
+            return
+        self.heap.append([priority, next(self.counter), key])
+        self.position[key] = len(self.heap) - 1
+        self.sift_up(len(self.heap) - 1)
+
+    def peek(self):
+        priority, _, key = self.heap[0]
+        return key, priority
+
+    def pop(self):
+        # 取出优先级最高（数值最小）的键
+        if not self.heap:
+            raise IndexError('pop from empty queue')
+        priority, _, key = self.heap[0]
+        self.delete_at(0)
+        return key, priority
+
+    def remove(self, key):
+        # 移除指定键，不存在时返回 False
+        index = self.position.get(key)
+        if index is None:
+            return False
+        self.delete_at(index)
+        return True
+
+    def update(self, key, priority):
+        # 修改优先级，保留原来的入队顺序
+        index = self.position[key]
+        entry = self.heap[index]
+        old, entry[0] = entry[0], priority
+        if priority < old:
+            self.sift_up(index)
+        elif priority > old:
+            self.sift_down(index)
+
+    def clear(self):
+        self.heap = []
+        self.position = {}
+
+    def delete_at(self, index):
+        del self.position[self.heap[index][2]]
+        last = self.heap.pop()
+        if index < len(self.heap):
+            self.heap[index] = last
+            self.position[last[2]] = index
+            self.sift_down(index)
+            self.sift_up(index)
+
+    def less(self, i, j):
+        a, b = self.heap[i], self.heap[j]
+        return a[0] < b[0] or (a[0] == b[0] and a[1] < b[1])
+
+    def swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.position[heap[i][2]] = i
+        self.position[heap[j][2]] = j
+
+    def sift_up(self, index):
+        while index > 0:
+            parent = (index - 1) >> 1
+            if self.less(index, parent):
+                self.swap(index, parent)
+                index = parent
+            else:
+                break
+
+    def sift_down(self, index):
+        size = len(self.heap)
+        while True:
+            smallest = index
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size and self.less(child, smallest):
+                    smallest = child
+            if smallest == index:
+                break
+            self.swap(index, smallest)
+            index = smallest